@@ -0,0 +1,210 @@
+"""
+Forecast backtesting of the Trailers Demand Planner.
+Replays the loaded history day by day: every day is planned by a
+forecast model from the days before it, like the daily forecast does,
+and compared with what was loaded. Unused trailers cost the cancellation
+charge, as in the unused haulage costs report, and trailers ordered on
+the day cost the same-day charge. A sweep over many models runs in
+a process pool and prints them ranked by total cost.
+
+Usage: python3 backtest.py loaded.csv [--models sma:3,5,7 ewma:0.3 ...]
+The history is a local CSV file with one day of loaded data per line
+(an optional first line with lane names is skipped) or a SQLite
+database of the planner as "sqlite:<path>".
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import forecast
+from storage import SqliteBackend
+
+# Models swept when none are given
+DEFAULT_MODELS = ["sma:3,5,7,10,14", "ewma:0.1,0.2,0.3,0.5", "weekday:1,2,4"]
+
+# Days at the start of the history only used to plan the days after them
+WARMUP_DAYS = 6
+
+RESULT_FIELDS = [
+    "rank", "model", "days", "unused", "same_day", "mean_error",
+    "unused_cost", "same_day_cost", "total_cost",
+]
+
+# History of the worker processes, sent once to each of them
+_history = None
+
+
+def read_history(path):
+    """
+    Returns the loaded history of a CSV file or "sqlite:<path>" database
+    as a 2-D array of integers, one row per day.
+    """
+    if path.startswith("sqlite:"):
+        rows = SqliteBackend(path[len("sqlite:"):]).read_all(["loaded"])
+        return forecast.to_array(rows["loaded"][1:])
+    with open(path, newline="", encoding="utf8") as csv_file:
+        rows = [row for row in csv.reader(csv_file) if row]
+    if rows and not all(cell.strip().lstrip("-").isdigit()
+                        for cell in rows[0]):
+        rows = rows[1:]
+    return forecast.to_array(rows)
+
+
+def expand_models(specs):
+    """
+    Expands specs with several parameters, e.g. "sma:3,5" to "sma:3"
+    and "sma:5". Raise ValueError if a model or parameter is invalid.
+    """
+    models = []
+    for spec in specs:
+        name, _, parameters = spec.partition(":")
+        for parameter in parameters.split(","):
+            model = f"{name}:{parameter}"
+            forecast.parse_model(model)
+            models.append(model)
+    return models
+
+
+def set_history(history):
+    """
+    Keeps the history in the worker process for all its backtests.
+    """
+    global _history
+    _history = history
+
+
+def replay(history, spec, warmup=WARMUP_DAYS):
+    """
+    Returns the planned and added_unused figures of every day after
+    warmup, each day planned by the model from the days before it.
+    """
+    rolling = forecast.RollingForecast.from_history(
+        spec, history[:warmup], history.shape[1]
+    )
+    planned = np.zeros_like(history[warmup:])
+    for day, loaded_row in enumerate(history[warmup:]):
+        planned[day] = rolling.planned()
+        rolling.push(loaded_row)
+    return planned, forecast.added_unused(planned, history[warmup:])
+
+
+def backtest(spec, charge, same_day_charge, warmup=WARMUP_DAYS):
+    """
+    Backtests the model over the history of the worker process.
+    Returns its result row, without rank.
+    """
+    _, added_unused = replay(_history, spec, warmup)
+    unused = int(np.clip(added_unused, 0, None).sum())
+    same_day = int(-np.clip(added_unused, None, 0).sum())
+    return {
+        "model": spec,
+        "days": len(added_unused),
+        "unused": unused,
+        "same_day": same_day,
+        "mean_error": round(float(np.abs(added_unused).mean()), 3)
+        if added_unused.size else 0.0,
+        "unused_cost": unused * charge,
+        "same_day_cost": same_day * same_day_charge,
+        "total_cost": unused * charge + same_day * same_day_charge,
+    }
+
+
+def sweep(history, models, charge, same_day_charge, warmup=WARMUP_DAYS,
+          workers=None):
+    """
+    Backtests all models in a process pool.
+    Returns result rows ranked by total cost, then by mean error.
+    Raise ValueError if there are no warmup days or no days after them.
+    """
+    if warmup < 1:
+        raise ValueError(f"{warmup} warmup days, at least 1 needed")
+    if len(history) <= warmup:
+        raise ValueError(
+            f"{len(history)} days of history, more than {warmup} needed"
+        )
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=set_history, initargs=(history,)
+    ) as executor:
+        results = list(executor.map(
+            backtest, models,
+            [charge] * len(models),
+            [same_day_charge] * len(models),
+            [warmup] * len(models),
+        ))
+    results.sort(key=lambda result: (result["total_cost"],
+                                     result["mean_error"]))
+    for rank, result in enumerate(results, 1):
+        result["rank"] = rank
+    return results
+
+
+def print_results(results):
+    """
+    Prints the ranked comparison of the models.
+    """
+    print(f"{'rank':>4}  {'model':<14}{'unused':>8}{'same day':>10}"
+          f"{'mean err':>10}{'total cost EUR':>16}")
+    for result in results:
+        print(f"{result['rank']:>4}  {result['model']:<14}"
+              f"{result['unused']:>8}{result['same_day']:>10}"
+              f"{result['mean_error']:>10.3f}{result['total_cost']:>16}")
+
+
+def save_results(results, path):
+    """
+    Saves the ranked comparison as CSV.
+    """
+    with open(path, "w", newline="", encoding="utf8") as results_file:
+        writer = csv.DictWriter(results_file, RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def parse_args():
+    """
+    Parses command line options of the backtest.
+    """
+    parser = argparse.ArgumentParser(
+        description="Trailers Demand Planner forecast backtest"
+    )
+    parser.add_argument(
+        "history", help="CSV file of loaded days or sqlite:<path>"
+    )
+    parser.add_argument(
+        "--models", nargs="+", default=DEFAULT_MODELS, metavar="SPEC",
+        help="models to sweep, e.g. sma:3,5,7 ewma:0.3 weekday:4"
+    )
+    parser.add_argument(
+        "--charge", type=int, default=250,
+        help="cancellation charge per unused trailer (EUR)"
+    )
+    parser.add_argument(
+        "--same-day-charge", type=int, default=250,
+        help="extra cost of a trailer ordered on the day (EUR)"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=WARMUP_DAYS,
+        help="days at the start only used to plan the days after them"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=os.cpu_count(),
+        help="processes backtesting models at the same time"
+    )
+    parser.add_argument(
+        "--csv", metavar="PATH", help="save the ranked comparison as CSV"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    RESULTS = sweep(
+        read_history(ARGS.history), expand_models(ARGS.models),
+        ARGS.charge, ARGS.same_day_charge, ARGS.warmup, ARGS.workers
+    )
+    print_results(RESULTS)
+    if ARGS.csv:
+        save_results(RESULTS, ARGS.csv)
@@ -0,0 +1,5 @@
+"""
+API-call and latency benchmarks of the Trailers Demand Planner menu paths,
+run against in-memory fakes of the gspread Spreadsheet & Worksheet.
+Run from the repository root with "python3 -m benchmarks".
+"""
@@ -0,0 +1,169 @@
+"""
+Runs startup and menu options 1-9 of run.py against synthetic fake
+spreadsheets from 5 lanes x 10 rows to 500 lanes x 5000 rows, prints
+API calls, payload and modeled time of each path and fails if any of
+them goes over its budget in budgets.json. Warm paths run after an
+earlier session has saved the local mirror and the spreadsheet metadata.
+Usage: python3 -m benchmarks [--update]
+--update writes the measured figures (time with 20% headroom) as budgets.
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import localstate
+import run
+from benchmarks.fakes import FakeSpreadsheet, synthetic_worksheets
+from scheduler import Scheduler
+from storage import GspreadBackend
+
+BUDGETS_FILE = os.path.join(os.path.dirname(__file__), "budgets.json")
+
+SIZES = [(5, 10), (50, 500), (500, 5000)]
+
+# Paths also measured after an earlier session, with the saved mirror
+WARM_PATHS = ["option 1", "option 9"]
+
+
+def menu_paths(lanes):
+    """
+    Returns the inputs typed for each menu path.
+    Paths not closing the program return to the menu and exit with 0.
+    """
+    return {
+        "startup": ["0"],
+        "option 1": ["1", "", "0"],
+        "option 2": ["2", "", "0"],
+        "option 3": ["3", "", "0"],
+        "option 4": ["4", "", "", "0"],
+        "option 5": ["5", "Benchmark, IE->Lane, IE"],
+        "option 6": ["6", "2", "y"],
+        "option 7": ["7", "y"],
+        "option 8": ["8", "y"],
+        "option 9": ["9", ",".join(["1"] * lanes)],
+    }
+
+
+def start_session(spreadsheet, inputs):
+    """
+    Runs the menu with the inputs as a new session of the program.
+    Returns the wall time.
+    """
+    backend = GspreadBackend(spreadsheet=spreadsheet)
+    run.open_backend = lambda storage: backend
+    run.open_storage.cache_clear()
+    run.open_worksheet.cache_clear()
+    run.SCHEDULER = Scheduler(per_minute=10 ** 9)
+    typed = iter(inputs)
+    builtins.input = lambda prompt="": next(typed)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run.main()
+    return time.perf_counter() - started
+
+
+def run_path(inputs, lanes, rows, warm=False):
+    """
+    Runs the menu with the inputs on a fresh synthetic spreadsheet,
+    if warm after a session that previewed the last loaded data.
+    Returns the call log of the fake and the wall time.
+    """
+    spreadsheet = FakeSpreadsheet(synthetic_worksheets(lanes, rows))
+    with tempfile.TemporaryDirectory() as state_dir:
+        localstate.STATE_DIR = state_dir
+        if warm:
+            start_session(spreadsheet, ["1", "", "0"])
+            # Opened by title, the earlier session saved the metadata too
+            GspreadBackend(spreadsheet=spreadsheet).metadata()
+            spreadsheet.log.clear()
+        wall = start_session(spreadsheet, inputs)
+    return spreadsheet.log, wall
+
+
+def measure():
+    """
+    Returns measured figures of every size and menu path.
+    """
+    results = {}
+    for lanes, rows in SIZES:
+        size = f"{lanes}x{rows}"
+        results[size] = {}
+        paths = menu_paths(lanes)
+        runs = [(path, inputs, False) for path, inputs in paths.items()]
+        runs += [(f"{path} warm", paths[path], True) for path in WARM_PATHS]
+        for path, inputs, warm in runs:
+            log, wall = run_path(inputs, lanes, rows, warm)
+            results[size][path] = {
+                "calls": log.count(),
+                "bytes": log.payload(),
+                "seconds": round(log.seconds(), 3),
+                "wall": round(wall, 3),
+            }
+    return results
+
+
+def check(results, budgets):
+    """
+    Prints the results against the budgets.
+    Returns False if any path is over its budget or has none.
+    """
+    passed = True
+    print(f"{'size':<10}{'path':<15}{'calls':>7}{'bytes':>12}"
+          f"{'modeled s':>11}{'wall s':>9}  budget")
+    for size, paths in results.items():
+        for path, result in paths.items():
+            budget = budgets.get(size, {}).get(path)
+            if budget is None:
+                verdict = "MISSING"
+            elif (result["calls"] > budget["calls"]
+                  or result["seconds"] > budget["seconds"]):
+                verdict = (f"OVER ({budget['calls']} calls, "
+                           f"{budget['seconds']}s)")
+            else:
+                verdict = "ok"
+            passed = passed and verdict == "ok"
+            print(f"{size:<10}{path:<15}{result['calls']:>7}"
+                  f"{result['bytes']:>12}{result['seconds']:>11.3f}"
+                  f"{result['wall']:>9.3f}  {verdict}")
+    return passed
+
+
+def main():
+    """
+    Measures all paths and checks or updates the budgets.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--update", action="store_true",
+                        help="write the measured figures as budgets")
+    args = parser.parse_args()
+
+    results = measure()
+    if args.update:
+        budgets = {
+            size: {
+                path: {"calls": result["calls"],
+                       "seconds": round(result["seconds"] * 1.2, 3)}
+                for path, result in paths.items()
+            }
+            for size, paths in results.items()
+        }
+        with open(BUDGETS_FILE, "w", encoding="utf8") as budgets_file:
+            json.dump(budgets, budgets_file, indent=2)
+            budgets_file.write("\n")
+        print(f"Budgets written to {BUDGETS_FILE}")
+
+    with open(BUDGETS_FILE, encoding="utf8") as budgets_file:
+        budgets = json.load(budgets_file)
+    if not check(results, budgets):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+"""
+In-memory fakes of the gspread Spreadsheet & Worksheet objects.
+They implement the methods the storage backend uses and record every
+call with its payload size and a modeled latency, so the cost of a menu
+path can be measured without the network.
+"""
+import json
+import re
+from datetime import date, timedelta
+
+from gspread.utils import a1_to_rowcol
+
+# Modeled Sheets API round trip and transfer speed
+REQUEST_LATENCY = 0.2
+BYTES_PER_SECOND = 2_000_000
+
+# Date of the first synthetic day, early enough for option 9 to add today
+FIRST_DATE = date(2000, 1, 1)
+
+
+class CallLog:
+    """
+    Calls made on the fakes, as (method, payload bytes, modeled seconds).
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def record(self, method, *payloads):
+        """
+        Records a call, its payload is the request plus the response.
+        """
+        size = sum(len(json.dumps(payload)) for payload in payloads)
+        seconds = REQUEST_LATENCY + size / BYTES_PER_SECOND
+        self.calls.append((method, size, seconds))
+
+    def clear(self):
+        """
+        Forgets all recorded calls.
+        """
+        self.calls.clear()
+
+    def count(self):
+        """
+        Returns how many calls were made.
+        """
+        return len(self.calls)
+
+    def payload(self):
+        """
+        Returns bytes sent and received by all calls.
+        """
+        return sum(size for _, size, _ in self.calls)
+
+    def seconds(self):
+        """
+        Returns modeled time of all calls made one after another.
+        """
+        return sum(seconds for _, _, seconds in self.calls)
+
+
+def cell_value(cell):
+    """
+    Returns the value of Sheets API cell data as the API would show it.
+    """
+    value = cell["userEnteredValue"]
+    value = value.get("numberValue", value.get("stringValue", ""))
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def parse_range(range_name):
+    """
+    Splits "'name'!A1:B2" into the worksheet name and the first & last
+    (row, col) of the range, None for parts that are not given.
+    """
+    name, _, cells = range_name.partition("!")
+    name = name.strip("'")
+    if not cells:
+        return name, None, None
+    first, _, last = cells.partition(":")
+
+    def rowcol(a1):
+        if not a1:
+            return None
+        if re.fullmatch(r"\d+", a1):
+            return int(a1), None
+        if re.fullmatch(r"[A-Z]+", a1):
+            return None, a1_to_rowcol(a1 + "1")[1]
+        return a1_to_rowcol(a1)
+
+    return name, rowcol(first), rowcol(last)
+
+
+class FakeWorksheet:
+    """
+    Worksheet holding its cells as rows of strings.
+    """
+
+    def __init__(self, spreadsheet, sheet_id, title, rows):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self.rows = rows
+        self.row_count = max(1000, len(rows))
+        self.col_count = max(26, max((len(row) for row in rows), default=0))
+
+    def values(self, first=None, last=None):
+        """
+        Returns values of the range the way the API does,
+        without trailing empty cells & rows.
+        """
+        first_row, first_col = first or (None, None)
+        last_row, last_col = last or (None, None)
+        first_row = first_row or 1
+        first_col = first_col or 1
+        rows = self.rows[first_row - 1:last_row]
+        values = []
+        for row in rows:
+            row = row[first_col - 1:last_col]
+            end = len(row)
+            while end and row[end - 1] == "":
+                end -= 1
+            values.append(row[:end])
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def write(self, row, col, values):
+        """
+        Writes a block of values starting at row & col.
+        """
+        for offset, block_row in enumerate(values):
+            while len(self.rows) < row + offset:
+                self.rows.append([])
+            cells = self.rows[row + offset - 1]
+            end = col - 1 + len(block_row)
+            cells.extend([""] * (end - len(cells)))
+            cells[col - 1:end] = [str(value) for value in block_row]
+
+
+class FakeSpreadsheet:
+    """
+    Spreadsheet of FakeWorksheets, recording calls in the log.
+    """
+
+    def __init__(self, worksheets, log=None):
+        self.id = "fake-spreadsheet"
+        self.title = "trailers_demand_planner"
+        self.log = log or CallLog()
+        self.sheets = {
+            title: FakeWorksheet(self, sheet_id, title, rows)
+            for sheet_id, (title, rows) in enumerate(worksheets.items())
+        }
+
+    def by_id(self, sheet_id):
+        """
+        Returns the worksheet with the sheet id.
+        """
+        for wksh in self.sheets.values():
+            if wksh.id == sheet_id:
+                return wksh
+        raise KeyError(sheet_id)
+
+    def worksheets(self):
+        response = [
+            {"properties": {"sheetId": wksh.id, "title": wksh.title}}
+            for wksh in self.sheets.values()
+        ]
+        self.log.record("worksheets", response)
+        return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self.log.record("worksheet", {"title": title})
+        return self.sheets[title]
+
+    def values_batch_get(self, ranges, params=None):
+        value_ranges = []
+        for range_name in ranges:
+            name, first, last = parse_range(range_name)
+            values = self.sheets[name].values(first, last)
+            value_range = {"range": range_name}
+            if values:
+                value_range["values"] = values
+            value_ranges.append(value_range)
+        response = {"spreadsheetId": self.id, "valueRanges": value_ranges}
+        self.log.record("values_batch_get", ranges, response)
+        return response
+
+    def values_batch_update(self, body):
+        for data in body["data"]:
+            name, first, _ = parse_range(data["range"])
+            self.sheets[name].write(first[0], first[1], data["values"])
+        self.log.record("values_batch_update", body)
+        return {"spreadsheetId": self.id}
+
+    def batch_update(self, body):
+        for request in body["requests"]:
+            if "appendCells" in request:
+                append = request["appendCells"]
+                wksh = self.by_id(append["sheetId"])
+                rows = [
+                    [cell_value(cell) for cell in row["values"]]
+                    for row in append["rows"]
+                ]
+                wksh.write(len(wksh.values()) + 1, 1, rows)
+            elif "deleteDimension" in request:
+                dimension = request["deleteDimension"]["range"]
+                wksh = self.by_id(dimension["sheetId"])
+                start, end = dimension["startIndex"], dimension["endIndex"]
+                if dimension["dimension"] == "ROWS":
+                    del wksh.rows[start:end]
+                else:
+                    for row in wksh.rows:
+                        del row[start:end]
+            elif "addSheet" in request:
+                properties = request["addSheet"]["properties"]
+                self.sheets[properties["title"]] = FakeWorksheet(
+                    self, properties["sheetId"], properties["title"], []
+                )
+            else:
+                raise NotImplementedError(request)
+        self.log.record("batch_update", body)
+        return {"spreadsheetId": self.id, "replies": []}
+
+
+def synthetic_worksheets(lanes, rows, seed=1):
+    """
+    Returns loaded, planned & added_unused rows with lanes columns
+    and rows days of loaded data, planned having one more day like
+    the planned worksheet always has, and the dates of the days.
+    """
+    headings = [f"Lane {lane}" for lane in range(1, lanes + 1)]
+    state = seed
+
+    def day():
+        nonlocal state
+        values = []
+        for _ in range(lanes):
+            state = (state * 1103515245 + 12345) % 2 ** 31
+            values.append(state % 10)
+        return values
+
+    loaded = [day() for _ in range(rows)]
+    planned = [day() for _ in range(rows + 1)]
+    added_unused = [
+        [plan - load for plan, load in zip(planned_day, loaded_day)]
+        for planned_day, loaded_day in zip(planned, loaded)
+    ]
+
+    def as_strings(days):
+        return [list(headings)] + [[str(v) for v in values] for values in days]
+
+    return {
+        "loaded": as_strings(loaded),
+        "planned": as_strings(planned),
+        "added_unused": as_strings(added_unused),
+        "dates": [["date"]] + [
+            [(FIRST_DATE + timedelta(days=number)).strftime("%Y%m%d")]
+            for number in range(rows)
+        ],
+    }
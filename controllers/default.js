@@ -1,11 +1,23 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const child_process = require('child_process');
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
+    // Planner service keeping the spreadsheet & data warm for all sessions
+    const service = child_process.spawn('python3', ['service.py'], {
+        cwd: process.env.PWD,
+        env: process.env,
+        stdio: 'inherit'
+    });
+
+    service.on('exit', function (code, signal) {
+        console.log("Planner service stopped, sessions run the planner themselves");
+    });
+
 };
 
 function socket() {
@@ -15,8 +27,8 @@ function socket() {
 
     this.on('open', function (client) {
 
-        // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
+        // Spawn terminal, connected to the planner service if it runs
+        client.tty = Pty.spawn('python3', ['session.py'], {
             name: 'xterm-color',
             cols: 80,
             rows: 24,
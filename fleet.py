@@ -0,0 +1,208 @@
+"""
+Fleet mode of the Trailers Demand Planner.
+Runs the daily forecast and the unused haulage costs report for many
+depots, one spreadsheet or database each, in a thread pool. All depots
+share the authorized client and the quota-aware SCHEDULER of run.py,
+so together they stay within the Sheets API quota, while each keeps
+its own cached worksheets and local state.
+
+Usage: python3 fleet.py depots.csv [--summary summary.csv]
+depots.csv has a header row and the columns:
+- depot: name of the depot
+- storage: e.g. "gsheets:trailers_demand_planner_cork" or "sqlite:cork.db"
+- loaded: CSV file with days of loaded data to save like --ingest does,
+  empty to only report
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import run
+from streams import ThreadStream
+
+# Depots worked on at the same time
+FLEET_WORKERS = int(os.environ.get("TDP_FLEET_WORKERS", "8"))
+
+SUMMARY_FIELDS = [
+    "depot", "storage", "status", "lanes", "days_saved", "planned",
+    "unused", "unused_cost", "recent_unused", "recent_cost",
+]
+
+
+def read_depots(path):
+    """
+    Returns the depots of the fleet file as dicts.
+    Raise ValueError if two depots have the same storage,
+    they would be worked on at the same time.
+    """
+    with open(path, newline="", encoding="utf8") as depots_file:
+        depots = [
+            {
+                "depot": row["depot"],
+                "storage": row["storage"],
+                "loaded": row.get("loaded") or "",
+            }
+            for row in csv.DictReader(depots_file)
+        ]
+    storages = [depot["storage"] for depot in depots]
+    for storage in storages:
+        if storages.count(storage) > 1:
+            raise ValueError(f"Storage of more than one depot: {storage}")
+    return depots
+
+
+def forecast_depot(depot, charge, chunk_days):
+    """
+    Saves the loaded data of the depot, if any, with its planned and
+    added_unused figures, and returns its summary row.
+    Runs in a thread of the pool, with the depot as its STORAGE and
+    its name as the label of the requests quota it uses.
+    """
+    run.STORAGE.set(depot["storage"])
+    run.SCHEDULER.start(f"Depot {depot['depot']}")
+    summary = {"depot": depot["depot"], "storage": depot["storage"]}
+    days_before = len(run.history("loaded"))
+    status = "ok"
+    if depot["loaded"]:
+        with open(depot["loaded"], newline="", encoding="utf8") as csv_file:
+            if not run.ingest_loaded_data(csv_file, chunk_days):
+                status = "stopped at invalid line"
+
+    aggregates = run.get_unused_aggregates()
+    recent_unused = sum(
+        value for value in run.history("added_unused")[-1].tolist()
+        if value > 0
+    )
+    summary.update({
+        "status": status,
+        "lanes": len(run.headings("planned")),
+        "days_saved": len(run.history("loaded")) - days_before,
+        "planned": int(run.history("planned")[-1].sum()),
+        "unused": aggregates.total(),
+        "unused_cost": aggregates.total() * charge,
+        "recent_unused": recent_unused,
+        "recent_cost": recent_unused * charge,
+    })
+    return summary
+
+
+def run_depot(depot, charge, chunk_days, output):
+    """
+    Runs forecast_depot capturing what it prints.
+    A depot that fails is reported in its summary row
+    and does not stop the others.
+    Returns the summary row and the printed text.
+    """
+    printed = io.StringIO()
+    output.bind(printed)
+    try:
+        summary = forecast_depot(depot, charge, chunk_days)
+    except Exception as error:
+        summary = {
+            "depot": depot["depot"],
+            "storage": depot["storage"],
+            "status": f"failed: {error}",
+        }
+    finally:
+        output.unbind()
+    return summary, printed.getvalue()
+
+
+def run_fleet(depots, charge, chunk_days=run.INGEST_CHUNK_DAYS,
+              workers=FLEET_WORKERS):
+    """
+    Runs all depots in the thread pool and prints the output of each
+    as it finishes. Returns summary rows in the order of depots.
+    """
+    output = ThreadStream(sys.stdout)
+    sys.stdout = output
+    try:
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="tdp-fleet"
+        ) as executor:
+            futures = [
+                executor.submit(run_depot, depot, charge, chunk_days, output)
+                for depot in depots
+            ]
+            summaries = []
+            for future in futures:
+                summary, text = future.result()
+                print(f"=== {summary['depot']} ({summary['status']}) ===")
+                print(text)
+                summaries.append(summary)
+    finally:
+        sys.stdout = output.stream
+    return summaries
+
+
+def print_summary(summaries):
+    """
+    Prints the consolidated summary of the fleet.
+    """
+    print(f"{'depot':<20}{'lanes':>6}{'days':>6}{'planned':>9}"
+          f"{'unused':>8}{'cost EUR':>11}  status")
+    for summary in summaries:
+        print(f"{summary['depot'][:19]:<20}"
+              f"{summary.get('lanes', ''):>6}"
+              f"{summary.get('days_saved', ''):>6}"
+              f"{summary.get('planned', ''):>9}"
+              f"{summary.get('unused', ''):>8}"
+              f"{summary.get('unused_cost', ''):>11}"
+              f"  {summary['status']}")
+    ok = [summary for summary in summaries if "unused_cost" in summary]
+    print(f"Fleet: {len(ok)} of {len(summaries)} depots reported, "
+          f"{sum(summary['planned'] for summary in ok)} trailers planned, "
+          f"{sum(summary['unused'] for summary in ok)} unused trailers cost "
+          f"€{sum(summary['unused_cost'] for summary in ok)}")
+
+
+def save_summary(summaries, path):
+    """
+    Saves the consolidated summary as CSV, one row per depot.
+    """
+    with open(path, "w", newline="", encoding="utf8") as summary_file:
+        writer = csv.DictWriter(summary_file, SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+
+def parse_args():
+    """
+    Parses command line options of the fleet mode.
+    """
+    parser = argparse.ArgumentParser(
+        description="Trailers Demand Planner fleet mode"
+    )
+    parser.add_argument("depots", help="CSV file with the depots")
+    parser.add_argument(
+        "--summary", metavar="CSV",
+        help="save the consolidated summary to a CSV file"
+    )
+    parser.add_argument(
+        "--charge", type=int, default=250,
+        help="cancellation charge per unused trailer (EUR)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=FLEET_WORKERS,
+        help="depots worked on at the same time"
+    )
+    parser.add_argument(
+        "--chunk-days", type=int, default=run.INGEST_CHUNK_DAYS,
+        help="days of loaded data saved in one request"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    SUMMARIES = run_fleet(
+        read_depots(ARGS.depots), ARGS.charge, ARGS.chunk_days, ARGS.workers
+    )
+    print_summary(SUMMARIES)
+    if ARGS.summary:
+        save_summary(SUMMARIES, ARGS.summary)
+    run.print_quota_report()
+    sys.exit(any(summary["status"] != "ok" for summary in SUMMARIES))
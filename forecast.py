@@ -0,0 +1,216 @@
+"""
+Vectorized forecasting engine for the Trailers Demand Planner.
+History of a worksheet is held as a 2-D integer array with one row
+per day of operations and one column per lane, so planned figures
+for all lanes are calculated at once.
+
+Models are chosen with a "name:parameter" spec:
+- "sma:5" simple moving average of the last 5 days (default)
+- "ewma:0.3" exponentially weighted average with smoothing factor 0.3
+- "weekday:4" average of the same weekday over the last 4 weeks
+"""
+import numpy as np
+
+DEFAULT_MODEL = "sma:5"
+
+# Rows are days of operations, so the same weekday repeats every 7 rows
+WEEK = 7
+
+
+def to_array(rows):
+    """
+    Converts rows of strings or numbers to a 2-D array of integers.
+    """
+    if not rows:
+        return np.zeros((0, 0), dtype=np.int64)
+    return np.array(rows, dtype=float).astype(np.int64)
+
+
+def moving_average(history, window):
+    """
+    Averages the last window days of each lane.
+    """
+    return history[-int(window):].mean(axis=0)
+
+
+def weighted_average(history, alpha):
+    """
+    Exponentially weighted average of each lane,
+    the most recent day weighs alpha, the one before alpha * (1 - alpha)...
+    Weights are normalized so they sum up to 1 over the available history.
+    """
+    ages = np.arange(len(history) - 1, -1, -1)
+    weights = alpha * (1 - alpha) ** ages
+    return weights @ history / weights.sum()
+
+
+def weekday_average(history, weeks):
+    """
+    Averages each lane over the days one, two... weeks before
+    the day that is being planned.
+    Falls back to all available days if there is less than a week.
+    """
+    days = len(history)
+    if days < WEEK:
+        return history.mean(axis=0)
+    same_weekday = np.arange(days - WEEK, -1, -WEEK)[:int(weeks)]
+    return history[same_weekday].mean(axis=0)
+
+
+MODELS = {
+    "sma": (moving_average, int),
+    "ewma": (weighted_average, float),
+    "weekday": (weekday_average, int),
+}
+
+
+def parse_model(spec):
+    """
+    Returns the model function and its parameter from a spec like "sma:5".
+    Raise ValueError if the model is unknown or the parameter invalid.
+    """
+    name, _, parameter = spec.partition(":")
+    if name not in MODELS:
+        raise ValueError(f"Unknown forecast model: {name}")
+    model, parameter_type = MODELS[name]
+    parameter = parameter_type(parameter)
+    if parameter <= 0:
+        raise ValueError(f"Forecast model parameter must be positive: {spec}")
+    return model, parameter
+
+
+def history_window(spec):
+    """
+    Returns how many most recent days the model needs,
+    or None if it uses the whole history.
+    """
+    model, parameter = parse_model(spec)
+    if model is moving_average:
+        return parameter
+    if model is weekday_average:
+        return WEEK * parameter
+    return None
+
+
+def planned(history, spec=DEFAULT_MODEL):
+    """
+    Calculates the planned figure of every lane for the next day,
+    rounded to whole trailers.
+    """
+    model, parameter = parse_model(spec)
+    return np.rint(model(history, parameter)).astype(np.int64)
+
+
+def added_unused(planned_row, loaded_row):
+    """
+    Subtracts loaded figures from planned ones for every lane.
+    """
+    return np.asarray(planned_row) - np.asarray(loaded_row)
+
+
+class RollingForecast:
+    """
+    Rolling state of the forecast model updated one day at a time,
+    so adding a day costs O(lanes) however long the history is:
+    - sma keeps a ring buffer of the last window days and their sums
+    - ewma keeps the running weighted sum and the sum of the weights
+    - weekday keeps a ring buffer of the last weeks * 7 days
+    Days count all days, filled how many slots of the buffer hold one,
+    fewer than the days while the history is shorter than the window.
+    """
+
+    def __init__(self, spec, lanes):
+        self.spec = spec
+        self.model, self.parameter = parse_model(spec)
+        self.days = 0
+        self.filled = 0
+        self.buffer = np.zeros((history_window(spec) or 0, lanes), np.int64)
+        self.sums = np.zeros(lanes)
+        self.weight = 0.0
+
+    @classmethod
+    def from_history(cls, spec, history, lanes=None, first_day=0):
+        """
+        Builds the rolling state from the history of all days.
+        Only the days that stay in the ring buffer are pushed.
+        first_day is how many days were before the history, e.g. compacted
+        into rollups; they are counted but not in the buffer, so the
+        planned figures are those of the history alone.
+        """
+        if lanes is None:
+            lanes = history.shape[1]
+        rolling = cls(spec, lanes)
+        rolling.days = first_day
+        if rolling.model is not weighted_average:
+            skipped = max(len(history) - len(rolling.buffer), 0)
+            rolling.days += skipped
+            history = history[skipped:]
+        for row in history:
+            rolling.push(row)
+        return rolling
+
+    def push(self, row):
+        """
+        Adds a day of loaded figures to the rolling state.
+        """
+        row = np.asarray(row, dtype=np.int64)
+        if self.model is weighted_average:
+            self.sums = self.parameter * row + (1 - self.parameter) * self.sums
+            self.weight = self.parameter + (1 - self.parameter) * self.weight
+        else:
+            position = self.days % len(self.buffer)
+            if self.model is moving_average:
+                self.sums += row - self.buffer[position]
+            self.buffer[position] = row
+            self.filled = min(self.filled + 1, len(self.buffer))
+        self.days += 1
+
+    def window(self):
+        """
+        Returns the days held in the ring buffer, oldest first.
+        """
+        size = len(self.buffer)
+        rolled = np.roll(self.buffer, -(self.days % size), axis=0)
+        return rolled[size - self.filled:]
+
+    def planned(self):
+        """
+        Calculates the planned figure of every lane for the next day,
+        the same as planned() over the whole history would.
+        """
+        if self.model is weighted_average:
+            values = self.sums / self.weight
+        elif self.model is moving_average:
+            values = self.sums / self.filled
+        else:
+            values = weekday_average(self.window(), self.parameter)
+        return np.rint(values).astype(np.int64)
+
+    def to_dict(self):
+        """
+        Returns the rolling state as a dict that can be saved as JSON.
+        """
+        return {
+            "spec": self.spec,
+            "days": self.days,
+            "filled": self.filled,
+            "buffer": self.buffer.tolist(),
+            "sums": self.sums.tolist(),
+            "weight": self.weight,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores the rolling state saved with to_dict().
+        """
+        rolling = cls(state["spec"], len(state["sums"]))
+        rolling.days = state["days"]
+        rolling.filled = state.get(
+            "filled", min(rolling.days, len(rolling.buffer))
+        )
+        if len(rolling.buffer):
+            rolling.buffer[:] = np.array(state["buffer"], dtype=np.int64)
+        rolling.sums = np.array(state["sums"], dtype=float)
+        rolling.weight = state["weight"]
+        return rolling
@@ -0,0 +1,363 @@
+"""
+Write-ahead journal of the Trailers Demand Planner.
+With TDP_JOURNAL=1 set, writes to the worksheets are recorded in an
+append-only journal file in the state directory and acknowledged at
+once, so the operator does not wait for the storage. A background
+flusher sends them in order, many of them coalesced into one
+all-or-nothing request, together with the journal position they reach.
+After a crash or a network loss the position saved with the data tells
+which writes were applied, so the others are sent again exactly once.
+A write the storage rejects stops the flusher until it is retried or
+discarded (python3 run.py --journal retry|discard).
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+from google.auth.exceptions import TransportError
+
+import localstate
+from storage import Backend
+
+# Seconds reads and the end of a session wait for journaled writes
+FLUSH_TIMEOUT = float(os.environ.get("TDP_FLUSH_TIMEOUT", "30"))
+
+# Seconds before writes failing on the network are sent again
+RETRY_DELAY = 5.0
+
+# Journaled writes sent together in one request at most
+BATCH_WRITES = 100
+
+# Errors of a network loss, after which the writes are sent again
+NETWORK_ERRORS = (
+    ConnectionError, TimeoutError, requests.ConnectionError,
+    requests.Timeout, TransportError
+)
+
+
+def worksheets_of(entry):
+    """
+    Returns the names of the worksheets a journal entry writes to.
+    """
+    names = []
+    for arg in entry["args"]:
+        if isinstance(arg, dict):
+            names += list(arg)
+        else:
+            names += [write[0] for write in arg]
+    return sorted(set(names))
+
+
+def coalesce(entries):
+    """
+    Returns the writes of journal entries as (method, args) pairs,
+    rows appended by consecutive entries joined into one append.
+    """
+    writes = []
+    for entry in entries:
+        method, args = entry["method"], entry["args"]
+        if method == "append_rows" and writes and (
+            writes[-1][0] == "append_rows"
+        ):
+            appended = writes[-1][1][0]
+            for name, rows in args[0].items():
+                appended[name] = appended.get(name, []) + rows
+        elif method == "append_rows":
+            writes.append((method, [dict(args[0])]))
+        else:
+            writes.append((method, args))
+    return writes
+
+
+class Journal:
+    """
+    Journal file of a storage with one JSON line per record:
+    an entry {"seq", "method", "args"} for each write, {"applied": seq}
+    once the entries up to seq are applied, {"failed": [seq, ...],
+    "error"} when entries were rejected, {"retried": seq} when their
+    failures are cleared and {"discarded": seq} when they are dropped.
+    Entries not applied or discarded are kept in memory too.
+    """
+
+    def __init__(self, key):
+        self.path = localstate.state_path(key, "journal", "jsonl")
+        self.condition = threading.Condition()
+        self.entries = {}
+        self.errors = {}
+        self.last = 0
+        self.load()
+
+    def load(self):
+        """
+        Reads the records of the journal file, if any, and rewrites it
+        with only the entries still to be applied, also dropping a last
+        line cut short by a crash.
+        """
+        try:
+            with open(self.path, encoding="utf8") as journal_file:
+                lines = journal_file.readlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if "seq" in record:
+                self.entries[record["seq"]] = record
+                self.last = max(self.last, record["seq"])
+            elif "applied" in record or "discarded" in record:
+                self.forget(record.get("applied", record.get("discarded")))
+            elif "failed" in record:
+                for seq in record["failed"]:
+                    self.errors[seq] = record["error"]
+            elif "retried" in record:
+                self.errors = {
+                    seq: error for seq, error in self.errors.items()
+                    if seq > record["retried"]
+                }
+        self.rewrite()
+
+    def forget(self, seq):
+        """
+        Drops the entries up to seq from memory.
+        """
+        self.last = max(self.last, seq)
+        for number in [number for number in self.entries if number <= seq]:
+            del self.entries[number]
+            self.errors.pop(number, None)
+
+    def rewrite(self):
+        """
+        Replaces the journal file at once with the journal position
+        and the entries still to be applied.
+        """
+        os.makedirs(localstate.STATE_DIR, exist_ok=True)
+        with open(self.path + ".tmp", "w", encoding="utf8") as journal_file:
+            applied = min(self.entries) - 1 if self.entries else self.last
+            journal_file.write(json.dumps({"applied": applied}) + "\n")
+            for seq in sorted(self.entries):
+                journal_file.write(json.dumps(self.entries[seq]) + "\n")
+                if seq in self.errors:
+                    journal_file.write(json.dumps(
+                        {"failed": [seq], "error": self.errors[seq]}
+                    ) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+    def write(self, record):
+        """
+        Appends a record to the journal file and waits until it is
+        on disk.
+        """
+        os.makedirs(localstate.STATE_DIR, exist_ok=True)
+        with open(self.path, "a", encoding="utf8") as journal_file:
+            journal_file.write(json.dumps(record) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+
+    def append(self, method, args):
+        """
+        Records a write of the backend method with its args.
+        Returns its journal position.
+        """
+        with self.condition:
+            # Positions grow with the clock too, so a journal started
+            # again, e.g. in a new state directory, never reuses the
+            # positions of writes the storage already has
+            self.last = max(self.last + 1, time.time_ns() // 1000)
+            entry = {"seq": self.last, "method": method, "args": args}
+            self.write(entry)
+            self.entries[self.last] = entry
+            self.condition.notify_all()
+            return self.last
+
+    def applied(self, seq):
+        """
+        Records that the entries up to seq are applied. The journal
+        file is emptied once no entry is left to apply.
+        """
+        with self.condition:
+            if not [number for number in self.entries if number <= seq]:
+                return
+            self.forget(seq)
+            if self.entries:
+                self.write({"applied": seq})
+            else:
+                self.rewrite()
+            self.condition.notify_all()
+
+    def failed(self, entries, error):
+        """
+        Records that the storage rejected the entries with the error.
+        """
+        with self.condition:
+            message = f"{type(error).__name__}: {error}"
+            self.write({
+                "failed": [entry["seq"] for entry in entries],
+                "error": message
+            })
+            for entry in entries:
+                self.errors[entry["seq"]] = message
+            self.condition.notify_all()
+
+    def retry(self):
+        """
+        Clears the failures so the flusher sends the entries again.
+        Returns how many entries had failed.
+        """
+        with self.condition:
+            failed = len(self.errors)
+            if failed:
+                self.write({"retried": self.last})
+                self.errors = {}
+                self.condition.notify_all()
+            return failed
+
+    def discard(self):
+        """
+        Drops the failed entries and all entries after them, which were
+        recorded on top of them. Returns how many entries were dropped.
+        """
+        with self.condition:
+            if not self.errors:
+                return 0
+            first = min(self.errors)
+            dropped = [seq for seq in self.entries if seq >= first]
+            self.write({"discarded": self.last})
+            self.forget(self.last)
+            self.condition.notify_all()
+            return len(dropped)
+
+    def pending(self):
+        """
+        Returns the entries still to be applied, in order.
+        """
+        with self.condition:
+            return [self.entries[seq] for seq in sorted(self.entries)]
+
+    def error(self, seq):
+        """
+        Returns the error the entry failed with, None if it did not.
+        """
+        return self.errors.get(seq)
+
+    def next_batch(self):
+        """
+        Waits until there are entries to send and no failed ones,
+        then returns up to BATCH_WRITES of them, in order.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.entries and not self.errors
+            )
+            return self.pending()[:BATCH_WRITES]
+
+    def wait(self, timeout=FLUSH_TIMEOUT):
+        """
+        Waits until all entries are applied, or some failed,
+        for up to timeout seconds. Returns True if all were applied.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: not self.entries or self.errors, timeout
+            )
+            return not self.entries
+
+
+class JournaledBackend(Backend):
+    """
+    Records the writes of a backend in its journal and returns at once.
+    A background thread flushes them to the backend in order. Reads
+    wait for the journaled writes to be flushed first, up to
+    FLUSH_TIMEOUT seconds. Adding a worksheet is not journaled, as
+    the writes after it need it to exist.
+    """
+
+    def __init__(self, backend, journal=None):
+        self.backend = backend
+        self.key = backend.key
+        self.journal = journal or Journal(backend.key)
+        # Error of the last attempt to flush, None once one succeeds
+        self.last_error = None
+        self.flusher = threading.Thread(target=self.flush, daemon=True)
+        self.flusher.start()
+
+    def flush(self):
+        """
+        Sends the journaled writes to the backend until the process ends.
+        The journal position saved with the data is looked up first,
+        and again after a failure, so no write is applied twice.
+        """
+        checked = False
+        while True:
+            batch = self.journal.next_batch()
+            try:
+                if not checked:
+                    self.journal.applied(self.backend.applied_mark())
+                    checked = True
+                    continue
+                self.backend.apply_writes(coalesce(batch), batch[-1]["seq"])
+                self.journal.applied(batch[-1]["seq"])
+                self.last_error = None
+            except Exception as error:
+                self.last_error = f"{type(error).__name__}: {error}"
+                # Nothing was sent if looking up the position failed
+                if checked and self.is_rejected(error):
+                    self.journal.failed(batch, error)
+                else:
+                    time.sleep(RETRY_DELAY)
+                checked = False
+
+    def is_rejected(self, error):
+        """
+        Checks if the storage rejected the writes with a client error,
+        or they failed locally, e.g. with a TypeError, so sending them
+        again would fail the same way. A network loss, a server error
+        or an error the backend can retry, e.g. a full quota, may pass
+        and the writes are sent again, which applies them only once.
+        """
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", 0)
+        return not (
+            isinstance(error, NETWORK_ERRORS)
+            or self.backend.is_retryable(error)
+            or 500 <= status < 600
+        )
+
+    def read_all(self, names):
+        self.journal.wait()
+        return self.backend.read_all(names)
+
+    def read_tails(self, tails):
+        self.journal.wait()
+        return self.backend.read_tails(tails)
+
+    def read_spans(self, spans):
+        self.journal.wait()
+        return self.backend.read_spans(spans)
+
+    def append_rows(self, rows):
+        self.journal.append("append_rows", [rows])
+
+    def write_cells(self, updates):
+        self.journal.append("write_cells", [updates])
+
+    def delete_dimensions(self, deletes):
+        self.journal.append("delete_dimensions", [deletes])
+
+    def append_and_delete(self, rows, deletes):
+        self.journal.append("append_and_delete", [rows, deletes])
+
+    def has_worksheet(self, name):
+        return self.backend.has_worksheet(name)
+
+    def add_worksheet(self, name, rows):
+        self.journal.wait()
+        return self.backend.add_worksheet(name, rows)
+
+    def is_retryable(self, error):
+        return self.backend.is_retryable(error)
@@ -0,0 +1,56 @@
+"""
+Local state files of the Trailers Demand Planner.
+Data derived from the worksheets that the planner keeps between
+sessions is saved as JSON in the TDP_STATE_DIR directory,
+with file names prefixed by the storage key so that states of
+different spreadsheets or databases never mix.
+"""
+import json
+import os
+
+STATE_DIR = os.environ.get("TDP_STATE_DIR", ".tdp_state")
+
+
+def state_path(key, name, extension="json"):
+    """
+    Returns the path of the state file for the storage key.
+    """
+    return os.path.join(STATE_DIR, f"{key}.{name}.{extension}")
+
+
+def load_state(key, name):
+    """
+    Returns the saved state or None if there is none or it is unreadable.
+    """
+    try:
+        with open(state_path(key, name), encoding="utf8") as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(key, name, state, private=False):
+    """
+    Saves the state, replacing the file at once so a crash
+    never leaves a half written state behind.
+    Private states, e.g. access tokens, are readable by the owner only.
+    """
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = state_path(key, name)
+    mode = 0o600 if private else 0o666
+    descriptor = os.open(
+        path + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode
+    )
+    with open(descriptor, "w", encoding="utf8") as state_file:
+        json.dump(state, state_file)
+    os.replace(path + ".tmp", path)
+
+
+def clear_state(key, name):
+    """
+    Deletes the saved state so it is rebuilt on next use.
+    """
+    try:
+        os.remove(state_path(key, name))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,163 @@
+"""
+Columnar local mirror of the Trailers Demand Planner worksheets.
+A worksheet is held as its lane names, with an index of their columns,
+and a 2-D integer array with one row per day of operations and one
+column per lane, instead of rows of strings. The mirror is saved
+between sessions next to the other local state, so on startup only
+the rows appended since the last sync have to be read.
+"""
+import os
+import zipfile
+
+import numpy as np
+
+import localstate
+
+
+def to_columns(rows, width):
+    """
+    Converts rows of strings to a 2-D array of integers width lanes wide.
+    Missing and empty cells are 0.
+    """
+    return np.array(
+        [
+            [cell or "0" for cell in row[:width]] + ["0"] * (width - len(row))
+            for row in rows
+        ],
+        dtype=float
+    ).reshape(len(rows), width).astype(np.int64)
+
+
+class ColumnMirror:
+    """
+    Lane names and integer columns of a worksheet.
+    Rows are numbered from 1 like in the worksheet: row 1 is the lane
+    names and row n is values[n - 2]. lanes is None until it is filled.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.lanes = None
+        self.index = {}
+        self.values = np.zeros((0, 0), dtype=np.int64)
+
+    def set_columns(self, lanes, values):
+        """
+        Replaces the lane names and the integer columns.
+        """
+        self.lanes = list(lanes)
+        self.index = {lane: column for column, lane in enumerate(lanes)}
+        self.values = values
+
+    def fill(self, rows):
+        """
+        Replaces the mirror with all rows read from the worksheet.
+        """
+        lanes = rows[0] if rows else []
+        self.set_columns(lanes, to_columns(rows[1:], len(lanes)))
+
+    def row_count(self):
+        """
+        Returns how many rows the worksheet has, lane names included.
+        """
+        if not self.lanes and not len(self.values):
+            return 0
+        return len(self.values) + 1
+
+    def extend(self, lanes, rows):
+        """
+        Appends rows read from the worksheet starting at its row_count().
+        The first of them must be the last row of the mirror and the lane
+        names must not have changed, otherwise the mirror is left as it is
+        and False is returned so it can be filled again from all rows.
+        """
+        if lanes != self.lanes or not rows:
+            return False
+        if len(self.values):
+            if not np.array_equal(
+                to_columns(rows[:1], len(self.lanes))[0], self.values[-1]
+            ):
+                return False
+        elif rows[0][:len(self.lanes)] != self.lanes:
+            return False
+        tail = to_columns(rows[1:], len(self.lanes))
+        self.values = np.concatenate([self.values, tail])
+        return True
+
+    def apply_cells(self, row, col, values):
+        """
+        Applies a block of values written to the worksheet,
+        starting at row & col, growing the columns where needed.
+        """
+        data_rows = [
+            (row + offset, block_row)
+            for offset, block_row in enumerate(values) if row + offset > 1
+        ]
+        width = max(
+            [len(self.lanes or [])]
+            + [col - 1 + len(block_row) for block_row in values]
+        )
+        height = max(
+            [len(self.values)] + [number - 1 for number, _ in data_rows]
+        )
+        if self.values.shape != (height, width):
+            grown = np.zeros((height, width), dtype=np.int64)
+            grown[:len(self.values), :self.values.shape[1]] = self.values
+            self.values = grown
+        lanes = list(self.lanes or [])
+        lanes.extend([""] * (width - len(lanes)))
+        if row == 1 and values:
+            lanes[col - 1:col - 1 + len(values[0])] = [
+                str(value) for value in values[0]
+            ]
+        self.set_columns(lanes, self.values)
+        for number, block_row in data_rows:
+            self.values[number - 2, col - 1:col - 1 + len(block_row)] = [
+                int(float(value or 0)) for value in block_row
+            ]
+
+    def delete_columns(self, start, end):
+        """
+        Deletes columns from start to end (inclusive).
+        """
+        lanes = self.lanes[:start - 1] + self.lanes[end:]
+        values = np.delete(self.values, np.s_[start - 1:end], axis=1)
+        self.set_columns(lanes, values)
+
+    def delete_rows(self, start, end):
+        """
+        Deletes rows from start to end (inclusive), below the lane names.
+        """
+        self.values = np.delete(self.values, np.s_[start - 2:end - 1], axis=0)
+
+    def path(self, key):
+        """
+        Returns the path of the saved mirror for the storage key.
+        """
+        return localstate.state_path(key, f"mirror_{self.name}", "npz")
+
+    def save(self, key):
+        """
+        Saves the mirror, replacing the file at once.
+        """
+        os.makedirs(localstate.STATE_DIR, exist_ok=True)
+        path = self.path(key)
+        with open(path + ".tmp", "wb") as mirror_file:
+            np.savez(
+                mirror_file,
+                lanes=np.array(self.lanes or [], dtype=str),
+                values=self.values
+            )
+        os.replace(path + ".tmp", path)
+
+    def load(self, key):
+        """
+        Restores the saved mirror. Returns False if there is none
+        or it is unreadable.
+        """
+        try:
+            with np.load(self.path(key)) as saved:
+                self.set_columns(saved["lanes"].tolist(), saved["values"])
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return False
+        return True
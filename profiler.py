@@ -0,0 +1,130 @@
+"""
+Hot-path instrumentation of the Trailers Demand Planner.
+Functions decorated with @instrument record, when profiling is enabled,
+how many times they ran, their wall time and the backend requests and
+bytes transferred while they ran (nested functions count for each
+function they run in). When it is disabled a call costs one flag check.
+"""
+import functools
+import json
+import threading
+import time
+
+ENABLED = False
+
+# Name of the row counting requests made outside instrumented functions
+TOTAL = "(all requests)"
+
+_stats = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def enable():
+    """
+    Starts recording.
+    """
+    global ENABLED
+    ENABLED = True
+
+
+def stats_of(name):
+    """
+    Returns the counters of the name, created empty the first time.
+    Must be called holding the lock.
+    """
+    return _stats.setdefault(
+        name, {"calls": 0, "seconds": 0.0, "requests": 0, "bytes": 0}
+    )
+
+
+def active():
+    """
+    Returns names of instrumented functions running in this thread.
+    """
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def instrument(function):
+    """
+    Decorator recording calls of the function while profiling is enabled.
+    """
+    name = function.__qualname__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return function(*args, **kwargs)
+        stack = active()
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - started
+            stack.pop()
+            with _lock:
+                stats = stats_of(name)
+                stats["calls"] += 1
+                stats["seconds"] += seconds
+
+    return wrapper
+
+
+def payload_size(value):
+    """
+    Returns the approximate size in bytes of a request or response.
+    """
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+def record_request(seconds, request, response):
+    """
+    Counts a backend request for every instrumented function running
+    in this thread and in the total.
+    """
+    if not ENABLED:
+        return
+    size = payload_size(request) + payload_size(response)
+    with _lock:
+        for name in set(active()) | {TOTAL}:
+            stats = stats_of(name)
+            stats["requests"] += 1
+            stats["bytes"] += size
+        total = stats_of(TOTAL)
+        total["calls"] += 1
+        total["seconds"] += seconds
+
+
+def report():
+    """
+    Returns a copy of all counters by name.
+    """
+    with _lock:
+        return {name: dict(stats) for name, stats in _stats.items()}
+
+
+def print_report():
+    """
+    Prints the counters as a table, slowest first.
+    """
+    rows = sorted(report().items(), key=lambda item: -item[1]["seconds"])
+    print(f"{'function':<32}{'calls':>6}{'total s':>9}{'mean ms':>9}"
+          f"{'requests':>9}{'bytes':>11}")
+    for name, stats in rows:
+        mean = stats["seconds"] * 1000 / max(stats["calls"], 1)
+        print(f"{name[:31]:<32}{stats['calls']:>6}{stats['seconds']:>9.3f}"
+              f"{mean:>9.1f}{stats['requests']:>9}{stats['bytes']:>11}")
+
+
+def save_report(path):
+    """
+    Saves the counters as JSON for monitoring.
+    """
+    with open(path, "w", encoding="utf8") as report_file:
+        json.dump(report(), report_file, indent=2)
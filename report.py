@@ -0,0 +1,161 @@
+"""
+Unused haulage costs aggregates for the Trailers Demand Planner.
+Positive added_unused figures are unused trailers. Their totals per lane
+and per period of PERIOD_DAYS days are kept with a checkpoint of the
+last row folded in, so each report only has to add the new rows.
+Days compacted out of the worksheets are added from their rollups,
+the unused trailers of each lane per period.
+Figures of a range of days are summarized with totals and percentiles.
+"""
+import numpy as np
+
+# Days of operations in one period of the cost breakdown
+PERIOD_DAYS = 7
+
+# Percentiles of daily figures in date range summaries
+PERCENTILES = (50, 90)
+
+
+def summarize(values, lanes, percentiles=PERCENTILES):
+    """
+    Returns a dict of lane name to the total and the percentiles of its
+    daily figures, values being a 2-D array of ints with one row per day
+    and one column per lane. Percentiles are None if there are no days.
+    """
+    totals = values.sum(axis=0).tolist()
+    points = {
+        percentile: (
+            np.percentile(values, percentile, axis=0).tolist()
+            if len(values) else [None] * len(lanes)
+        )
+        for percentile in percentiles
+    }
+    return {
+        lane: dict(
+            total=totals[column],
+            **{f"p{percentile}": points[percentile][column]
+               for percentile in percentiles}
+        )
+        for column, lane in enumerate(lanes)
+    }
+
+
+def unused_periods(history):
+    """
+    Returns the unused trailers of each lane per period of a history
+    of whole periods, a 2-D array of ints with one row per day.
+    """
+    periods = len(history) // PERIOD_DAYS
+    unused = np.clip(history[:periods * PERIOD_DAYS], 0, None)
+    return unused.reshape(
+        periods, PERIOD_DAYS, history.shape[1]
+    ).sum(axis=1)
+
+
+class UnusedAggregates:
+    """
+    Totals of unused trailers per lane and per period.
+    rows is the checkpoint: how many added_unused rows are folded in,
+    last_row is the last of them, used to check the checkpoint still
+    matches the worksheet. first_day is how many days before the first
+    row were compacted into rollups, always whole periods.
+    """
+
+    def __init__(self, lanes, first_day=0):
+        self.lanes = list(lanes)
+        self.first_day = first_day
+        self.rows = 0
+        self.last_row = None
+        self.lane_totals = np.zeros(len(self.lanes), dtype=np.int64)
+        self.period_totals = np.zeros(0, dtype=np.int64)
+
+    def matches(self, lanes, history, first_day=0):
+        """
+        Checks if the aggregates were folded from the same lanes,
+        the same compacted days and the same first rows as the history.
+        """
+        if lanes != self.lanes or self.rows > len(history):
+            return False
+        if first_day != self.first_day:
+            return False
+        if self.rows == 0:
+            return True
+        return np.array_equal(history[self.rows - 1], self.last_row)
+
+    def add_periods(self, periods):
+        """
+        Adds rollups of compacted days, a 2-D array of ints with the
+        unused trailers of each lane per period, oldest first.
+        """
+        self.lane_totals += periods.sum(axis=0)
+        self.period_totals = np.concatenate([
+            periods.sum(axis=1).astype(np.int64),
+            self.period_totals[len(periods):]
+        ])
+
+    def fold(self, history):
+        """
+        Adds the rows of history, a 2-D array of ints with one row
+        per day, after the checkpoint to the totals.
+        """
+        new_rows = history[self.rows:]
+        if not len(new_rows):
+            return
+        unused = np.clip(new_rows, 0, None)
+        self.lane_totals += unused.sum(axis=0)
+
+        days = np.arange(self.rows, len(history)) + self.first_day
+        periods = days // PERIOD_DAYS
+        period_count = periods[-1] + 1
+        if len(self.period_totals) < period_count:
+            self.period_totals = np.concatenate([
+                self.period_totals,
+                np.zeros(period_count - len(self.period_totals), np.int64)
+            ])
+        np.add.at(self.period_totals, periods, unused.sum(axis=1))
+
+        self.rows = len(history)
+        self.last_row = history[-1].tolist()
+
+    def total(self):
+        """
+        Returns unused trailers of all lanes and all rows.
+        """
+        return int(self.lane_totals.sum())
+
+    def per_lane(self):
+        """
+        Returns a dict of lane name to its unused trailers.
+        """
+        return dict(zip(self.lanes, self.lane_totals.tolist()))
+
+    def per_period(self):
+        """
+        Returns unused trailers of each period, oldest first.
+        """
+        return self.period_totals.tolist()
+
+    def to_dict(self):
+        """
+        Returns the aggregates as a dict that can be saved as JSON.
+        """
+        return {
+            "lanes": self.lanes,
+            "first_day": self.first_day,
+            "rows": self.rows,
+            "last_row": self.last_row,
+            "lane_totals": self.lane_totals.tolist(),
+            "period_totals": self.period_totals.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        """
+        Restores the aggregates saved with to_dict().
+        """
+        aggregates = cls(state["lanes"], state.get("first_day", 0))
+        aggregates.rows = state["rows"]
+        aggregates.last_row = state["last_row"]
+        aggregates.lane_totals = np.array(state["lane_totals"], np.int64)
+        aggregates.period_totals = np.array(state["period_totals"], np.int64)
+        return aggregates
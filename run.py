@@ -1,19 +1,146 @@
-import gspread
-from google.oauth2.service_account import Credentials
+import argparse
+import atexit
+import contextlib
+import contextvars
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+import forecast
+import profiler
+from journal import Journal, JournaledBackend, worksheets_of
+from localstate import clear_state, load_state, save_state
+from mirror import ColumnMirror
+from report import PERIOD_DAYS, UnusedAggregates, summarize, unused_periods
+from scheduler import ScheduledBackend, Scheduler
+from storage import open_backend
+
+WORKSHEETS = ["loaded", "planned", "added_unused"]
+
+# Operations date of each day of the 3 worksheets as a number like
+# 20261018, 0 for days saved before dates were, added with the first date
+DATES = "dates"
+
+# Unused trailers of each lane per period of days compacted out of
+# the 3 worksheets, added once the history is first compacted
+ROLLUP = "unused_rollup"
+
+# Seconds after which cached worksheets are read again from the sheet
+CACHE_TTL = 600
+
+# Storage of the depot worked on, set for each depot by the fleet mode
+STORAGE = contextvars.ContextVar(
+    "storage", default=os.environ.get("TDP_STORAGE", "")
+)
+
+# Counts and paces all requests within the Sheets API quota
+SCHEDULER = Scheduler()
+
+# Forecast model for planned figures, see forecast.py, e.g. "ewma:0.3"
+FORECAST_MODEL = os.environ.get("TDP_FORECAST", forecast.DEFAULT_MODEL)
+
+# Rows of default data below the headings that options 7 & 8 never delete,
+# planned has one more
+DEFAULT_DAYS = int(os.environ.get("TDP_DEFAULT_DAYS", "6"))
+
+# Days of loaded data saved together in one request by the bulk ingest
+# and read together in one request by the export
+INGEST_CHUNK_DAYS = 500
+
+# Fields of the records of the export, one per lane and day
+EXPORT_FIELDS = ["lane", "day", "date", "loaded", "planned", "added_unused"]
+
+# Days kept in the 3 worksheets when older ones are compacted into the
+# ROLLUP worksheet after the daily forecast & ingest, 0 to keep all
+RETENTION_DAYS = int(os.environ.get("TDP_RETENTION_DAYS", "0"))
+
+# Writes are journaled and flushed in the background, see journal.py
+JOURNAL = os.environ.get("TDP_JOURNAL", "0") == "1"
+
+
+def get_backend():
+    """
+    Returns the storage backend of the depot worked on, chosen by
+    the TDP_STORAGE variable: the Google Sheet by default,
+    e.g. "gsheets:<title>" for another one or "sqlite:planner.db".
+    """
+    return open_storage(STORAGE.get())
 
-SCOPE = [
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-    "https://www.googleapis.com/auth/drive"
-    ]
 
-CREDS = Credentials.from_service_account_file('creds.json')
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
-SHEET = GSPREAD_CLIENT.open('trailers_demand_planner')
-LOADED = SHEET.worksheet("loaded")
-PLANNED = SHEET.worksheet("planned")
-ADDED_UNUSED = SHEET.worksheet("added_unused")
+@lru_cache(maxsize=None)
+def open_storage(storage):
+    """
+    Opens the storage backend, once per session.
+    All its requests go through the quota-aware SCHEDULER.
+    Writes are journaled with JOURNAL set, or while the journal still
+    has writes of an earlier session, which are flushed at exit.
+    """
+    backend = ScheduledBackend(open_backend(storage), SCHEDULER)
+    journal = Journal(backend.key)
+    if not JOURNAL and not journal.pending():
+        return backend
+    backend = JournaledBackend(backend, journal)
+    atexit.register(flush_journal, backend)
+    return backend
+
+
+def get_journal():
+    """
+    Returns the journal of the depot worked on, None if writes
+    are not journaled.
+    """
+    return getattr(get_backend(), "journal", None)
+
+
+def flush_journal(backend):
+    """
+    At exit, waits up to FLUSH_TIMEOUT seconds for the journaled writes
+    to be saved to the worksheets, then tells the operator about
+    the writes left in the journal.
+    """
+    journal = backend.journal
+    if journal.pending() and not journal.errors:
+        print("Saving journaled writes to the worksheets...")
+        journal.wait()
+    print_journal_status(backend)
+
+
+def print_journal_status(backend=None):
+    """
+    Prints how many journaled writes are not saved to the worksheets
+    yet and how many failed, if any.
+    """
+    backend = backend or get_backend()
+    journal = getattr(backend, "journal", None)
+    if journal is None:
+        return
+    entries = journal.pending()
+    failed = len([entry for entry in entries if journal.error(entry["seq"])])
+    if len(entries) > failed:
+        print(f"{len(entries) - failed} write(s) waiting to be saved "
+              "to the worksheets, kept in the journal.")
+        if backend.last_error:
+            print(f"Last attempt failed with {backend.last_error}")
+    if failed:
+        print(f"{failed} write(s) rejected by the worksheets, "
+              "see python3 run.py --journal")
+
+
+@lru_cache(maxsize=None)
+def storage_lock(storage):
+    """
+    Returns the lock that lets one thread at a time sync the cached
+    worksheets of the storage or write to them. It is reentrant, so
+    changes that read the cache and write from it hold it throughout.
+    """
+    return threading.RLock()
 
 
 def logo():
@@ -53,32 +180,465 @@ def menu():
     print("-----------------------------")
 
 
-def flatten_list(_2d_list):
+def worksheet_names():
     """
-    Taken from https://stackabuse.com/python-how-to-flatten-list-of-lists/
-    Flattens list of lists to a single list.
+    Returns the worksheets of the depot worked on: loaded, planned &
+    added_unused, DATES once days are dated and ROLLUP once the history
+    has been compacted.
     """
-    flat_list = []
-    for element in _2d_list:
-        if type(element) is list:
-            for item in element:
-                flat_list.append(item)
-        else:
-            flat_list.append(element)
-    return flat_list
+    backend = get_backend()
+    return WORKSHEETS + [
+        name for name in (DATES, ROLLUP) if backend.has_worksheet(name)
+    ]
 
 
-def lane_count(wksh):
+def day_worksheets():
     """
-    Counts and returns how many rows with lane names are in use.
-    Based on https://stackoverflow.com/
+    Returns the worksheets with a row per day, all but ROLLUP.
+    """
+    return [name for name in worksheet_names() if name != ROLLUP]
+
+
+def lane_worksheets():
+    """
+    Returns the worksheets with a column per lane, all but DATES.
+    """
+    return [name for name in worksheet_names() if name != DATES]
+
+
+@profiler.instrument
+def load_snapshot(names=WORKSHEETS):
+    """
+    Reads loaded, planned & added_unused worksheets in one batched request.
+    Returns a dict with the rows of each worksheet, headings row first.
+    Rows are padded to the headings width like get_all_values() does.
+    """
+    return get_backend().read_all(names)
+
+
+class CachedWorksheet(ColumnMirror):
+    """
+    Write-through cache in front of a worksheet of the storage backend,
+    held as lane names and integer columns (see mirror.py).
+    Reads are served from the local copy, which is synced for all
+    worksheets at once and synced again after CACHE_TTL seconds.
+    Writes are sent to the worksheet, or to the journal (see journal.py),
+    first and then applied locally, so the local copy stays in step
+    without reading it again.
+    The local copy is saved after every sync and write.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.synced_at = None
+        self.lock = threading.Lock()
+
+    def is_stale(self):
+        """
+        Checks if the local copy was never synced or is older than CACHE_TTL.
+        """
+        if self.synced_at is None:
+            return True
+        return time.monotonic() - self.synced_at > CACHE_TTL
+
+    def synced(self):
+        """
+        Returns the worksheet after syncing it if it is stale.
+        """
+        if self.is_stale():
+            refresh_cache(stale_only=True)
+        return self
+
+    def save(self, key=None):
+        """
+        Saves the local copy for the next session.
+        """
+        with self.lock:
+            super().save(key or get_backend().key)
+
+
+def get_worksheet(name):
+    """
+    Returns the cached worksheet of the depot worked on.
+    """
+    return open_worksheet(STORAGE.get(), name)
+
+
+@lru_cache(maxsize=None)
+def open_worksheet(storage, name):
+    """
+    Creates the cached worksheet of the storage, once per session.
+    """
+    return CachedWorksheet(name)
+
+
+def synced_worksheets(names):
+    """
+    Returns a dict of worksheet name to its cached worksheet, synced
+    before a write, so the write is applied to the local copy without
+    syncing it again and reading back rows the write already added.
+    """
+    return {name: get_worksheet(name).synced() for name in names}
+
+
+@profiler.instrument
+def append_rows(rows):
+    """
+    Appends rows to the worksheets in one all-or-nothing request
+    and to the cached worksheets once the request has succeeded.
+    Rows is a dict of worksheet name to the list of rows to append.
+    """
+    with storage_lock(STORAGE.get()):
+        worksheets = synced_worksheets(rows)
+        get_backend().append_rows(rows)
+        for name, name_rows in rows.items():
+            wksh = worksheets[name]
+            wksh.apply_cells(wksh.row_count() + 1, 1, name_rows)
+            wksh.save()
+
+
+@profiler.instrument
+def write_cells(updates):
+    """
+    Writes blocks of values to the worksheets in one request
+    and applies them to the cached worksheets.
+    Updates are (worksheet name, row, col, list of rows) tuples.
+    """
+    with storage_lock(STORAGE.get()):
+        worksheets = synced_worksheets(name for name, _, _, _ in updates)
+        get_backend().write_cells(updates)
+        for name, row, col, values in updates:
+            worksheets[name].apply_cells(row, col, values)
+        for wksh in worksheets.values():
+            wksh.save()
+
+
+@profiler.instrument
+def delete_rows(deletes):
+    """
+    Deletes rows from the worksheets in one all-or-nothing request
+    and from the cached worksheets once the request has succeeded.
+    Deletes is a dict of worksheet name to the first & last rows to delete.
+    """
+    with storage_lock(STORAGE.get()):
+        worksheets = synced_worksheets(deletes)
+        get_backend().delete_dimensions([
+            (name, "ROWS", start, end)
+            for name, (start, end) in deletes.items()
+        ])
+        for name, (start, end) in deletes.items():
+            worksheets[name].delete_rows(start, end)
+            worksheets[name].save()
+
+
+@profiler.instrument
+def delete_columns(deletes):
+    """
+    Deletes columns from the worksheets in one all-or-nothing request
+    and from the cached worksheets once the request has succeeded.
+    Deletes are (worksheet name, first column, last column) tuples,
+    applied in order.
+    """
+    with storage_lock(STORAGE.get()):
+        worksheets = synced_worksheets(name for name, _, _ in deletes)
+        get_backend().delete_dimensions([
+            (name, "COLUMNS", start, end) for name, start, end in deletes
+        ])
+        for name, start, end in deletes:
+            worksheets[name].delete_columns(start, end)
+        for wksh in worksheets.values():
+            wksh.save()
+
+
+@profiler.instrument
+def append_and_delete_rows(rows, deletes):
+    """
+    Appends rows to the worksheets and then deletes rows from them in
+    one all-or-nothing request, and does the same to the cached
+    worksheets once the request has succeeded.
+    Rows is a dict of worksheet name to the list of rows to append,
+    deletes a dict of worksheet name to the first & last rows to delete.
+    """
+    with storage_lock(STORAGE.get()):
+        worksheets = synced_worksheets(set(rows) | set(deletes))
+        get_backend().append_and_delete(rows, [
+            (name, "ROWS", start, end)
+            for name, (start, end) in deletes.items()
+        ])
+        for name, name_rows in rows.items():
+            wksh = worksheets[name]
+            wksh.apply_cells(wksh.row_count() + 1, 1, name_rows)
+        for name, (start, end) in deletes.items():
+            worksheets[name].delete_rows(start, end)
+        for wksh in worksheets.values():
+            wksh.save()
+
+
+@profiler.instrument
+def add_worksheet(name, rows):
+    """
+    Adds a worksheet with the rows, headings first, in one request
+    and caches it once the request has succeeded.
+    """
+    with storage_lock(STORAGE.get()):
+        get_backend().add_worksheet(name, rows)
+        wksh = get_worksheet(name)
+        wksh.fill(rows)
+        wksh.synced_at = time.monotonic()
+        wksh.save()
+
+
+@profiler.instrument
+def refresh_cache(stale_only=False):
+    """
+    Syncs the cached worksheets with the storage backend.
+    The local copies saved by the last session are used when there are
+    any, then only the rows appended since, and the last row before them
+    to check nothing above has changed, are read in one batched request.
+    Otherwise, or if the check fails, all rows are read again.
+    With stale_only it is skipped if another thread has just synced them.
+    """
+    with storage_lock(STORAGE.get()):
+        worksheets = [get_worksheet(name) for name in worksheet_names()]
+        if stale_only and not any(wksh.is_stale() for wksh in worksheets):
+            return
+        key = get_backend().key
+        for wksh in worksheets:
+            if wksh.lanes is None:
+                wksh.load(key)
+        synced = all(wksh.row_count() and wksh.lanes for wksh in worksheets)
+        journal = get_journal()
+        if synced and journal and journal.pending() and all(
+            wksh.synced_at is not None for wksh in worksheets
+        ):
+            # The cached worksheets already have the journaled writes
+            # the storage may not have yet, so they are not read again
+            pass
+        elif synced:
+            tails = get_backend().read_tails({
+                wksh.name: (wksh.row_count(), len(wksh.lanes))
+                for wksh in worksheets
+            })
+            synced = all(
+                [wksh.extend(*tails[wksh.name]) for wksh in worksheets]
+            )
+        if not synced:
+            snapshot = load_snapshot([wksh.name for wksh in worksheets])
+            for wksh in worksheets:
+                wksh.fill(snapshot[wksh.name])
+        for wksh in worksheets:
+            wksh.synced_at = time.monotonic()
+            wksh.save(key)
+
+
+def headings(name):
+    """
+    Returns lane names from the first row of the cached worksheet.
+    """
+    return get_worksheet(name).synced().lanes
+
+
+def history(name):
+    """
+    Returns all rows of data below the headings from the cached worksheet
+    as a 2-D array of integers, one row per day and one column per lane.
+    """
+    return get_worksheet(name).synced().values
+
+
+def last_row(name):
+    """
+    Returns the last row from the cached worksheet as a list of strings.
+    """
+    wksh = get_worksheet(name).synced()
+    if not len(wksh.values):
+        return list(wksh.lanes)
+    return [str(value) for value in wksh.values[-1].tolist()]
+
+
+def compacted_days():
+    """
+    Returns how many days were compacted into the ROLLUP worksheet
+    before the first row of the 3 worksheets.
+    """
+    if ROLLUP not in worksheet_names():
+        return 0
+    return len(history(ROLLUP)) * PERIOD_DAYS
+
+
+def lane_values(name, lanes):
+    """
+    Returns all rows of data of the cached worksheet with the columns
+    of the lanes in their order, as a 2-D array of integers.
+    """
+    columns = [lane_column(name, lane) - 1 for lane in lanes]
+    return get_worksheet(name).synced().values[:, columns]
+
+
+def rollup_periods(lanes):
+    """
+    Returns the unused trailers of the lanes per compacted period
+    from the ROLLUP worksheet, as a 2-D array of integers.
+    """
+    return lane_values(ROLLUP, lanes)
+
+
+def date_number(day):
+    """
+    Returns the date as the number kept in DATES, e.g. 20261018.
+    """
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def parse_date(text):
+    """
+    Returns the date number of an ISO date, e.g. "2026-10-18".
+    Raise ValueError if it is not a valid date.
+    """
+    return date_number(date.fromisoformat(text))
+
+
+def next_date(number):
+    """
+    Returns the date number of the day after a date number.
+    """
+    day = date(number // 10000, number // 100 % 100, number % 100)
+    return date_number(day + timedelta(days=1))
+
+
+def format_date(number):
+    """
+    Returns the date number as an ISO date, or "undated" for 0.
+    """
+    if not number:
+        return "undated"
+    return f"{number // 10000:04}-{number // 100 % 100:02}-{number % 100:02}"
+
+
+def last_date():
+    """
+    Returns the date number of the last day saved, 0 if it is undated.
+    """
+    if DATES not in worksheet_names() or not len(history(DATES)):
+        return 0
+    return int(history(DATES)[-1, 0])
+
+
+def add_dates_worksheet():
+    """
+    Adds the DATES worksheet with the days already saved undated.
     """
-    lane_count = len(wksh.row_values(1))
+    days = len(history("loaded"))
+    add_worksheet(DATES, [["date"]] + [[0]] * days)
 
-    return lane_count
 
+def day_span(dates, first_date, last_date_number):
+    """
+    Returns the first day row and the one after the last dated from
+    first_date to last_date_number (inclusive), numbered from 0 like
+    history(), found by binary search of the sorted dates.
+    No days are dated in a range that ends before it starts.
+    """
+    first = int(dates.searchsorted(first_date, "left"))
+    last = int(dates.searchsorted(last_date_number, "right"))
+    return first, max(last, first)
 
-planned_lane_count = lane_count(PLANNED)
+
+def span_values(rows, headings_row, lanes, name):
+    """
+    Returns the columns of the lanes in their order from rows read from
+    a worksheet with the headings row, as a 2-D array of integers.
+    Raise ValueError if the worksheet has no such lane.
+    """
+    missing = set(lanes) - set(headings_row)
+    if missing:
+        raise ValueError(f"Lane '{sorted(missing)[0]}' not found in {name}")
+    columns = [headings_row.index(lane) for lane in lanes]
+    return np.array(
+        [[cell_value(row, column) for column in columns] for row in rows],
+        dtype=np.int64
+    ).reshape(len(rows), len(lanes))
+
+
+@profiler.instrument
+def query_range(first_date, last_date_number):
+    """
+    Returns how many days are dated from first_date to last_date_number
+    (inclusive), a dict of loaded, planned & unused to the summary of
+    each lane over those days (see report.summarize) and how many days
+    compacted into ROLLUP are left out of a range starting before the
+    first day kept.
+    The cached worksheets are not used: only the first columns of DATES
+    and ROLLUP are read to find the rows of the days by binary search,
+    then the headings and the span of those rows of the 3 worksheets.
+    """
+    backend = get_backend()
+    names = [name for name in (DATES, ROLLUP) if name in worksheet_names()]
+    columns = {name: ([], []) for name in (DATES, ROLLUP)}
+    if names:
+        columns.update(backend.read_tails({name: (2, 1) for name in names}))
+    dates = np.array(
+        [cell_value(row, 0) for row in columns[DATES][1]], dtype=np.int64
+    )
+    compacted = len(columns[ROLLUP][1]) * PERIOD_DAYS
+    if not len(dates) or not dates[0] or first_date >= dates[0]:
+        # Compacted days are before the first day kept, undated if it is
+        compacted = 0
+    first, last = day_span(dates, first_date, last_date_number)
+    headings_rows = {
+        name: (rows or [[]])[0]
+        for name, rows in backend.read_spans(
+            {name: (1, 1) for name in WORKSHEETS}
+        ).items()
+    }
+    spans = {name: [] for name in WORKSHEETS}
+    if last > first:
+        spans = backend.read_spans(
+            {name: (first + 2, last + 1) for name in WORKSHEETS}
+        )
+    lanes = headings_rows["loaded"]
+    figures = {
+        figure: span_values(spans[name], headings_rows[name], lanes, name)
+        for figure, name in (
+            ("loaded", "loaded"), ("planned", "planned"),
+            ("unused", "added_unused")
+        )
+    }
+    figures["unused"] = figures["unused"].clip(0)
+    return last - first, {
+        figure: summarize(values, lanes) for figure, values in figures.items()
+    }, compacted
+
+
+def print_range_summary(first_date, last_date_number):
+    """
+    For the query option of the command line.
+    Prints the totals and percentiles of the loaded, planned & unused
+    trailers of each lane over the days from first_date to
+    last_date_number (inclusive), and how many older days were
+    compacted and are left out.
+    """
+    days, summaries, compacted = query_range(first_date, last_date_number)
+    print(f"{days} days from {format_date(first_date)} "
+          f"to {format_date(last_date_number)}.")
+    if compacted:
+        print(f"{compacted} older days were compacted into {ROLLUP} "
+              "and are not included, see option 4 for their unused "
+              "trailers.")
+    if not days:
+        return
+    for figure, summary in summaries.items():
+        print(f"\n{figure}:")
+        for lane, stats in summary.items():
+            print(f"- {lane}: total {stats['total']}, "
+                  f"p50 {stats['p50']:g}, p90 {stats['p90']:g}")
+
+
+def planned_lane_count():
+    """
+    Returns how many lanes are planned for next loading.
+    """
+    return len(headings("planned"))
 
 
 def get_loaded_data():
@@ -91,7 +651,7 @@ def get_loaded_data():
     """
     while True:
         print("Please enter used equipment data from the last operations.")
-        print(f"{planned_lane_count} numbers, separated by commas.")
+        print(f"{planned_lane_count()} numbers, separated by commas.")
         print("Example: 1,2,3,4,5,6,(...)\n")
 
         data_str = input("Enter your data here:\n")
@@ -111,9 +671,10 @@ def validate_data(values):
     """
     try:
         [int(value) for value in values]
-        if len(values) != planned_lane_count:
+        lanes = planned_lane_count()
+        if len(values) != lanes:
             raise ValueError(
-                f"{planned_lane_count} values required, provided {len(values)}"
+                f"{lanes} values required, provided {len(values)}"
             )
     except ValueError as e:
         print(f"Invalid data: {e}, please try again. \n")
@@ -121,17 +682,21 @@ def validate_data(values):
     return True
 
 
-def update_worksheet(data, worksheet):
+@profiler.instrument
+def update_worksheets(data):
     """
-    Receives a list of integers to be inserted into a worksheet
-    Update the relevant worksheet with the data provided
+    Receives a dict of worksheet name to the list of integers
+    to be inserted into that worksheet.
+    Updates all the worksheets with the data provided in one request,
+    so either all of them are updated or none.
     """
-    print(f"Updating {worksheet} worksheet...\n")
-    worksheet_to_update = SHEET.worksheet(worksheet)
-    worksheet_to_update.append_row(data)
-    print(f"{worksheet} worksheet updated successfully.\n")
+    names = ", ".join(data)
+    print(f"Updating {names} worksheets...\n")
+    append_rows({worksheet: [row] for worksheet, row in data.items()})
+    print(f"{names} worksheets updated successfully.\n")
 
 
+@profiler.instrument
 def calculate_added_unused_data(loaded_row):
     """
     Compare loaded values with planned
@@ -141,43 +706,55 @@ def calculate_added_unused_data(loaded_row):
     - Negative number indicates trailers requested on the same day.
     """
     print("Calculating added_unused data...\n")
-    planned = PLANNED.get_all_values()
-    planned_row = planned[-1]
-    added_unused_data = []
-    for planned, loaded in zip(planned_row, loaded_row):
-        added_unused = int(planned) - loaded
-        added_unused_data.append(added_unused)
-    return added_unused_data
+    planned_row = history("planned")[-1]
+    return forecast.added_unused(planned_row, loaded_row).tolist()
 
 
-def get_last_5_entries_loaded():
+@profiler.instrument
+def get_rolling_forecast():
+    """
+    Returns the rolling forecast state of the loaded worksheet.
+    The saved state is used when it covers exactly the compacted days,
+    the rows and the lanes of the cached loaded worksheet with the
+    FORECAST_MODEL, otherwise it is built again from the loaded history.
     """
-    Collects columns of data from loaded worksheet, collecting
-    the last 5 entries for each lane and returns the data
-    as a list of lists.
+    rows = history("loaded")
+    lanes = headings("loaded")
+    first_day = compacted_days()
+    state = load_state(get_backend().key, "rolling")
+    if (
+        state is not None
+        and state["lanes"] == lanes
+        and state["rolling"]["spec"] == FORECAST_MODEL
+        and state["rolling"]["days"] == first_day + len(rows)
+        and "filled" in state["rolling"]
+    ):
+        return forecast.RollingForecast.from_dict(state["rolling"])
+
+    print("Rebuilding forecast from loaded history...\n")
+    return forecast.RollingForecast.from_history(
+        FORECAST_MODEL, rows, len(lanes), first_day
+    )
+
+
+def save_rolling_forecast(rolling):
     """
-    column_count = lane_count(LOADED) + 1
-    columns = []
-    for ind in range(1, column_count):
-        column = LOADED.col_values(ind)
-        columns.append(column[-5:])
-    return columns
+    Saves the rolling forecast state for the next daily forecast.
+    """
+    save_state(get_backend().key, "rolling", {
+        "lanes": headings("loaded"),
+        "rolling": rolling.to_dict()
+    })
 
 
-def calculate_planned_data(data):
+@profiler.instrument
+def calculate_planned_data(rolling):
     """
-    Calculate the average planned for each lane.
+    Calculate the planned figure for each lane from the rolling state
+    of the FORECAST_MODEL, by default the average of the last 5 days.
     """
     print("Calculating planned data...\n")
-    new_planned_data = []
-
-    for column in data:
-        int_column = [int(num) for num in column]
-        average = sum(int_column) / len(int_column)
-        planned_num = average
-        new_planned_data.append(round(planned_num))
-
-    return new_planned_data
+    return rolling.planned().tolist()
 
 
 def daily_trailer_forecast():
@@ -185,35 +762,235 @@ def daily_trailer_forecast():
     For Menu option 9.
     Runs daily trailer forecast update functions.
     Option 9 is based on Code Institute's walkthrough project Love Sandwiches.
+    All figures are calculated from the cached worksheets first
+    and then saved to the 3 worksheets, with today's date to DATES,
+    together in one request. The day is not saved if a later date
+    was already saved. The figures are calculated and saved holding
+    the storage lock, so no other session writes in between.
+    Days past RETENTION_DAYS are then compacted if it is set.
     """
+    operations_date = date_number(date.today())
+    if operations_date < last_date():
+        print(f"Days until {format_date(last_date())} are already saved, "
+              "please check the date of this computer.\n")
+        return
     data = get_loaded_data()
     loaded_data = [int(num) for num in data]
-    update_worksheet(loaded_data, "loaded")
-    new_added_unused_data = calculate_added_unused_data(loaded_data)
-    update_worksheet(new_added_unused_data, "added_unused")
-    loaded_column = get_last_5_entries_loaded()
-    planned_data = calculate_planned_data(loaded_column)
-    update_worksheet(planned_data, "planned")
+    with storage_lock(STORAGE.get()):
+        # Another session may have saved a day or changed the lanes
+        # while the figures were entered
+        if operations_date < last_date():
+            print(f"Days until {format_date(last_date())} were saved "
+                  "meanwhile, the day is not saved.\n")
+            return
+        if len(loaded_data) != planned_lane_count():
+            print("The lanes were changed meanwhile, "
+                  "please enter the data again.\n")
+            return
+        new_added_unused_data = calculate_added_unused_data(loaded_data)
+        rolling = get_rolling_forecast()
+        rolling.push(loaded_data)
+        planned_data = calculate_planned_data(rolling)
+        if DATES not in worksheet_names():
+            add_dates_worksheet()
+        update_worksheets({
+            "loaded": loaded_data,
+            "added_unused": new_added_unused_data,
+            "planned": planned_data,
+            DATES: [operations_date]
+        })
+        save_rolling_forecast(rolling)
+    if RETENTION_DAYS:
+        compact_history()
+
+
+def ingest_loaded_data(lines, chunk_days=INGEST_CHUNK_DAYS):
+    """
+    For bulk ingest mode.
+    Reads days of used equipment figures from CSV lines, one day per line
+    with as many numbers as lanes, an optional first line with lane names
+    is skipped. A line may start with the ISO date of its day, which must
+    not be before the date of the day before it. A day without one is
+    saved undated (0) while no dated day is saved, otherwise it is dated
+    the day after the day before it.
+    Each day is validated like in option 9 and its added_unused
+    and planned figures are calculated in sequence from the day before.
+    Days are saved to the 3 worksheets and DATES in chunks of chunk_days
+    per request.
+    Stops at the first invalid line, after saving the days before it.
+    Days past RETENTION_DAYS are then compacted if it is set.
+    Returns True if all lines were saved, False if it stopped.
+    """
+    lanes = headings("planned")
+    planned_row = history("planned")[-1]
+    rolling = get_rolling_forecast()
+    if DATES not in worksheet_names():
+        add_dates_worksheet()
+    previous_date = last_date()
+    chunk = {"loaded": [], "added_unused": [], "planned": [], DATES: []}
+    saved_days = 0
+    completed = True
+
+    def save_chunk():
+        """
+        Saves the days collected so far and the rolling forecast state.
+        """
+        days = len(chunk["loaded"])
+        if days:
+            append_rows(chunk)
+            save_rolling_forecast(rolling)
+            print(f"{saved_days + days} days saved to the worksheets.\n")
+        for rows in chunk.values():
+            rows.clear()
+        return days
+
+    for line_number, values in enumerate(csv.reader(lines), 1):
+        values = [value.strip() for value in values]
+        if not any(values) or (
+            line_number == 1 and values in (lanes, ["date"] + lanes)
+        ):
+            continue
+        operations_date = next_date(previous_date) if previous_date else 0
+        if len(values) == len(lanes) + 1:
+            try:
+                operations_date = parse_date(values.pop(0))
+            except ValueError as e:
+                print(f"Invalid date: {e}")
+                operations_date = None
+        if operations_date is not None and operations_date < previous_date:
+            print(f"Date {format_date(operations_date)} is before "
+                  f"{format_date(previous_date)}, the day before it.")
+            operations_date = None
+        if operations_date is None or not validate_data(values):
+            print(f"Line {line_number} is invalid, ingest stopped.\n")
+            completed = False
+            break
 
+        previous_date = operations_date
+        chunk[DATES].append([operations_date])
+        loaded_data = [int(value) for value in values]
+        chunk["loaded"].append(loaded_data)
+        chunk["added_unused"].append(
+            forecast.added_unused(planned_row, loaded_data).tolist()
+        )
+        rolling.push(loaded_data)
+        planned_row = rolling.planned()
+        chunk["planned"].append(planned_row.tolist())
 
-def get_last_loaded():
+        if len(chunk["loaded"]) >= chunk_days:
+            saved_days += save_chunk()
+
+    saved_days += save_chunk()
+    if RETENTION_DAYS:
+        compact_history()
+    return completed
+
+
+def cell_value(row, column):
     """
-    For Menu option 1.
-    Collects columns of data from loaded worksheet, collecting
-    the last entry for each lane and returns the data
-    as a list of strings.
+    Returns the integer in the column of a row read from a worksheet,
+    0 if the cell is empty or past the end of the row.
     """
-    column_count = lane_count(LOADED) + 1
+    return int(float(row[column] or 0)) if column < len(row) else 0
+
 
-    last_loaded_columns = []
-    for ind in range(1, column_count):
-        last_loaded_column = LOADED.col_values(ind)
-        last_loaded_columns.append(last_loaded_column[-1:])
-    last_loaded_columns_str = [''.join(x) for x in last_loaded_columns]
-    return last_loaded_columns_str
+def export_records(chunk_days=INGEST_CHUNK_DAYS):
+    """
+    Yields the records of each day saved in the 3 worksheets, in order,
+    a dict of EXPORT_FIELDS for each lane. The worksheets are read
+    chunk_days rows at a time, all of them in one request, so only
+    one chunk is held in memory.
+    Days are numbered from 1, compacted days included, and dated from
+    DATES, None if undated. The planned figures of the next day are
+    not exported, there are no loaded figures of it yet.
+    Raise ValueError if a lane of loaded is not in another worksheet.
+    """
+    names = day_worksheets()
+    day = 0
+    if ROLLUP in worksheet_names():
+        # Only the first column of the rollups is read to count them,
+        # the cached worksheets are not synced
+        _, rollups = get_backend().read_tails({ROLLUP: (2, 1)})[ROLLUP]
+        day = len(rollups) * PERIOD_DAYS
+    first = 2
+    columns = None
+    while True:
+        chunk = get_backend().read_spans({
+            name: (1 if columns is None else first, first + chunk_days - 1)
+            for name in names
+        })
+        if columns is None:
+            headings_rows = {
+                name: rows.pop(0) if rows else []
+                for name, rows in chunk.items()
+            }
+            lanes = headings_rows["loaded"]
+            columns = {}
+            for name in WORKSHEETS:
+                missing = set(lanes) - set(headings_rows[name])
+                if missing:
+                    raise ValueError(
+                        f"Lane '{sorted(missing)[0]}' not found in {name}"
+                    )
+                columns[name] = [
+                    headings_rows[name].index(lane) for lane in lanes
+                ]
+        for offset in range(len(chunk["loaded"])):
+            day += 1
+            rows = {
+                name: (chunk[name][offset:offset + 1] or [[]])[0]
+                for name in chunk
+            }
+            operations_date = cell_value(rows.get(DATES, []), 0)
+            yield [
+                {
+                    "lane": lane,
+                    "day": day,
+                    "date": format_date(operations_date)
+                    if operations_date else None,
+                    **{
+                        name: cell_value(rows[name], columns[name][number])
+                        for name in WORKSHEETS
+                    },
+                }
+                for number, lane in enumerate(lanes)
+            ]
+        if len(chunk["loaded"]) < chunk_days:
+            return
+        first += chunk_days
+
+
+@profiler.instrument
+def export_history(out, export_format="csv", chunk_days=INGEST_CHUNK_DAYS):
+    """
+    For export mode.
+    Writes the records of export_records() to the out file as they are
+    read, as CSV with a header line or as JSON Lines ("jsonl"), so memory
+    use stays the same however many days are saved.
+    Returns how many days were exported.
+    """
+    days = 0
+    if export_format == "jsonl":
+        for records in export_records(chunk_days):
+            out.writelines(json.dumps(record) + "\n" for record in records)
+            days += 1
+    else:
+        writer = csv.DictWriter(out, EXPORT_FIELDS)
+        writer.writeheader()
+        for records in export_records(chunk_days):
+            writer.writerows(records)
+            days += 1
+    return days
 
 
-last_loaded_data = get_last_loaded()
+@profiler.instrument
+def get_last_loaded():
+    """
+    For Menu option 1.
+    Collects the last entry for each lane from the cached loaded worksheet
+    and returns the data as a list of strings.
+    """
+    return last_row("loaded")
 
 
 def get_last_loaded_values(data):
@@ -221,32 +998,17 @@ def get_last_loaded_values(data):
     For Menu option 1.
     Return the last loaded numbers with the heading of each lane.
     """
-    headings = LOADED.get_all_values()[0]
-    return {heading: data for heading, data in zip(headings, data)}
-
-
-last_loaded_values = get_last_loaded_values(last_loaded_data)
+    return dict(zip(headings("loaded"), data))
 
 
+@profiler.instrument
 def get_last_planned():
     """
     For Menu option 2.
-    Collects columns of data from planned worksheet, collecting
-    the last entry for each lane and returns the data
-    as a list os strings.
+    Collects the last entry for each lane from the cached planned worksheet
+    and returns the data as a list of strings.
     """
-    column_count = lane_count(PLANNED) + 1
-
-    last_planned_columns = []
-    for ind in range(1, column_count):
-        last_planned_column = PLANNED.col_values(ind)
-        last_planned_columns.append(last_planned_column[-1:])
-
-    last_planned_columns_str = [''.join(x) for x in last_planned_columns]
-    return last_planned_columns_str
-
-
-last_planned_data = get_last_planned()
+    return last_row("planned")
 
 
 def get_last_planned_values(data):
@@ -254,32 +1016,17 @@ def get_last_planned_values(data):
     For Menu option 2.
     Return the last planned numbers with the heading of each lane.
     """
-    headings = PLANNED.get_all_values()[0]
-    return {heading: data for heading, data in zip(headings, data)}
-
-
-last_planned_values = get_last_planned_values(last_planned_data)
+    return dict(zip(headings("planned"), data))
 
 
+@profiler.instrument
 def get_last_added_unused():
     """
     For Menu option 3.
-    Collects columns of data from planned worksheet, collecting
-    the last entry for each lane and returns the data
-    as a list os strings.
+    Collects the last entry for each lane from the cached
+    added_unused worksheet and returns the data as a list of strings.
     """
-    column_count = lane_count(ADDED_UNUSED) + 1
-
-    last_added_unused_columns = []
-    for ind in range(1, column_count):
-        last_added_unused_column = ADDED_UNUSED.col_values(ind)
-        last_added_unused_columns.append(last_added_unused_column[-1:])
-
-    last_added_unused_col_str = [''.join(x) for x in last_added_unused_columns]
-    return last_added_unused_col_str
-
-
-last_added_unused_data = get_last_added_unused()
+    return last_row("added_unused")
 
 
 def get_last_added_unused_values(data):
@@ -287,35 +1034,35 @@ def get_last_added_unused_values(data):
     For Menu option 3.
     Return the last added_unused numbers with the heading of each lane.
     """
-    headings = ADDED_UNUSED.get_all_values()[0]
-    return {heading: data for heading, data in zip(headings, data)}
+    return dict(zip(headings("added_unused"), data))
 
 
-last_added_unused_values = get_last_added_unused_values(last_added_unused_data)
-
-
-def added_unused_values():
+@profiler.instrument
+def get_unused_aggregates():
     """
     For Menu option 4.
-    Access data from added_unused worksheet,
-    converts it to list of lists of ints,
-    flatten the list of lists to one list of ints.
+    Returns unused trailers aggregates of all lanes of the cached
+    added_unused worksheet and the rollups of compacted days. The saved
+    aggregates are used when they still match the worksheets and only
+    rows added since their checkpoint are folded in, otherwise they are
+    built again from the rollups and all rows.
+    The updated aggregates are saved for the next report.
     """
-    column_count = lane_count(ADDED_UNUSED) + 1
-
-    unsd_haul_cols = []
-
-    for ind in range(1, 8):
-        unused_haulage_column = ADDED_UNUSED.col_values(ind)
-        unsd_haul_cols.append(unused_haulage_column[1:])
-
-    # code from stackoverflow.com
-    int_und_haul_cls = ([[int(float(j)) for j in i] for i in unsd_haul_cols])
-
-    return flatten_list(int_und_haul_cls)
-
-
-added_unused_values = added_unused_values()
+    lanes = headings("added_unused")
+    rows = history("added_unused")
+    first_day = compacted_days()
+    state = load_state(get_backend().key, "unused")
+    aggregates = None
+    if state is not None:
+        aggregates = UnusedAggregates.from_dict(state)
+    if aggregates is None or not aggregates.matches(lanes, rows, first_day):
+        aggregates = UnusedAggregates(lanes, first_day)
+        if first_day:
+            aggregates.add_periods(rollup_periods(lanes))
+
+    aggregates.fold(rows)
+    save_state(get_backend().key, "unused", aggregates.to_dict())
+    return aggregates
 
 
 def unused_haulage_costs():
@@ -325,9 +1072,9 @@ def unused_haulage_costs():
     per trailer from the user via the terminal, which must be a number
     or adds 250 as data for cancellation charge value if the input is empty.
     The loop will repeatedly request data, until it is valid.
-    Filters data from entire added_unused worksheet
-    and only recent row to collect only positive numbers,
-    adds all positive numbers, and multiplies the sum by
+    Takes sums of positive numbers (unused trailers) of entire
+    added_unused worksheet per lane and per period from the aggregates,
+    sums positive numbers of only recent row, and multiplies the sums by
     the entered/default amount for cancellation charge per trailer
     to calculate the cancellation costs.
     """
@@ -344,19 +1091,33 @@ def unused_haulage_costs():
         else:
             True
 
-    # From https://www.codespeedy.com/
-    und_haul_vals = list(filter(lambda x: (x > 0), added_unused_values))
+    aggregates = get_unused_aggregates()
 
-    und_haul_sum = sum(und_haul_vals)
+    und_haul_sum = aggregates.total()
 
     und_haul_costs = und_haul_sum * int(canc_char)
 
     # From https://stackoverflow.com/
-    int_last_added_unused_data = list(map(int, last_added_unused_data))
+    int_last_added_unused_data = list(map(int, get_last_added_unused()))
     lt_und_data = list(filter(lambda x: (x > 0), int_last_added_unused_data))
     last_und_sum = sum(lt_und_data)
     last_unused_cost = last_und_sum * int(canc_char)
 
+    print("Cancelled trailers cost per lane:")
+    for lane, lane_sum in aggregates.per_lane().items():
+        print(f"- {lane}: {lane_sum} trailer(s) cost: "
+              f"€{lane_sum * int(canc_char)}")
+    print("")
+
+    print(f"Cancelled trailers cost per {PERIOD_DAYS} days of operations:")
+    periods = list(enumerate(aggregates.per_period()))
+    for period, period_sum in periods[-4:]:
+        first_day = period * PERIOD_DAYS + 1
+        last_day = first_day + PERIOD_DAYS - 1
+        print(f"- days {first_day}-{last_day}: {period_sum} trailer(s) cost: "
+              f"€{period_sum * int(canc_char)}")
+    print("")
+
     print(f"Total {und_haul_sum} cancelled trailers cost: €{und_haul_costs}\n")
     print(f"Recently {last_und_sum} trailer(s) cost: €{last_unused_cost}\n")
 
@@ -387,42 +1148,90 @@ def request_new_lane():
     return lane
 
 
-def add_lane(lane):
+def has_lane(lane):
     """
-    For Menu option 5.
-    Based on https://stackoverflow.com/
-    Adds entered by the user lane to all 3 worksheets.
+    Checks if the lane is in the lane index of the planned worksheet.
     """
-    def add_heading(wksh):
-        """
-        Add a new column with the lane name to the worksheet.
-        """
-        first_row = len(wksh.row_values(1))
-        column = first_row+1
-        wksh.update_cell(1, column, lane)
-    print("Adding headings...")
+    return lane in get_worksheet("planned").synced().index
 
-    add_heading(LOADED)
-    add_heading(PLANNED)
-    add_heading(ADDED_UNUSED)
 
-    def add_values(wksh):
-        """
-        Adds values 0 to cells under the heading of the lane to be added.
-        """
-        row_range = len(wksh.col_values(1)) + 1
+def lane_column(name, lane):
+    """
+    Returns the column of the lane in the cached worksheet.
+    Raise ValueError if the worksheet has no such lane.
+    """
+    index = get_worksheet(name).synced().index
+    if lane not in index:
+        raise ValueError(f"Lane '{lane}' not found in {name}")
+    return index[lane] + 1
+
+
+@profiler.instrument
+def add_lanes(lanes):
+    """
+    Adds new lanes to all worksheets in one batched request.
+    Columns with the lane name headings and values 0 under them
+    are written after the last lane of every worksheet.
+    Raise ValueError if a lane is blank, repeated or already added.
+    """
+    with storage_lock(STORAGE.get()):
+        for lane in lanes:
+            if lane == "" or has_lane(lane) or lanes.count(lane) > 1:
+                raise ValueError(f"Lane '{lane}' cannot be added")
+        updates = []
+        for name in lane_worksheets():
+            wksh = get_worksheet(name).synced()
+            zeros = [["0"] * len(lanes)] * (wksh.row_count() - 1)
+            updates.append(
+                (name, 1, len(wksh.lanes) + 1, [list(lanes)] + zeros)
+            )
+        write_cells(updates)
+
+
+@profiler.instrument
+def delete_lanes(lanes):
+    """
+    Deletes lanes by name from all worksheets in one batched request.
+    Columns of each worksheet are deleted from the last one,
+    so the columns of the others do not move before they are deleted.
+    Raise ValueError if a lane is not in every worksheet.
+    """
+    with storage_lock(STORAGE.get()):
+        deletes = []
+        for name in lane_worksheets():
+            columns = sorted(
+                {lane_column(name, lane) for lane in lanes}, reverse=True
+            )
+            deletes.extend((name, column, column) for column in columns)
+        delete_columns(deletes)
 
-        row = len(wksh.row_values(2))
-        column = row+1
 
-        for i in range(2, row_range):
-            wksh.update_cell(i, column, "0")
+@profiler.instrument
+def rename_lane(lane, new_lane):
+    """
+    Renames a lane in all worksheets in one batched request.
+    Raise ValueError if the lane is not in every worksheet
+    or the new name is blank or already used.
+    """
+    with storage_lock(STORAGE.get()):
+        if new_lane == "" or has_lane(new_lane):
+            raise ValueError(f"Lane '{new_lane}' cannot be used")
+        write_cells([
+            (name, 1, lane_column(name, lane), [[new_lane]])
+            for name in lane_worksheets()
+        ])
 
-    print("updating worksheets...")
 
-    add_values(LOADED)
-    add_values(PLANNED)
-    add_values(ADDED_UNUSED)
+def add_lane(lane):
+    """
+    For Menu option 5.
+    Based on https://stackoverflow.com/
+    Adds entered by the user lane to all 3 worksheets.
+    A new column with the lane name heading and values 0 under it
+    is written to every worksheet in one batched request.
+    """
+    print("Adding headings & updating worksheets...")
+    add_lanes([lane])
 
     print(f"Lane '{lane}' has been added successfully.\n")
 
@@ -432,9 +1241,8 @@ def lane_names():
     For Menu option 6.
     Prints lane names that are planned for next loading
     """
-    headings = PLANNED.get_all_values()[0]
     print("Following lanes are planned for next loading:\n")
-    print(headings)
+    print(headings("planned"))
     print("")
 
 
@@ -449,7 +1257,7 @@ def delete_lane():
     while True:
         print("Choose a lane to be deleted by entering its index.")
         print("From the left the index number of the first one is 1.")
-        print(f"Lanes indexes are from 1 to {lane_count(PLANNED)}")
+        print(f"Lanes indexes are from 1 to {planned_lane_count()}")
         lane_index = input("Please enter index number, example: 1:\n")
 
         if validate_index(lane_index):
@@ -466,10 +1274,7 @@ def delete_lane():
 
         if confirm_index == "yes" or confirm_index == "y":
 
-            # From https://stackoverflow.com/
-            LOADED.delete_columns(lane_index_int)
-            PLANNED.delete_columns(lane_index_int)
-            ADDED_UNUSED.delete_columns(lane_index_int)
+            delete_lanes([headings("planned")[lane_index_int - 1]])
 
             print(f"Lane index: {lane_index} has been deleted successfully\n")
             print("Closing program...")
@@ -488,13 +1293,14 @@ def validate_index(index):
     """
     Inside the try, converts all string values into integers.
     Raise ValueError if strings cannot be converted into int,
-    or if the input is more than number of indexes.
+    or if the input is not between 1 and the number of indexes.
     """
     try:
         [int(index)]
-        if int(index) > planned_lane_count:
+        lanes = planned_lane_count()
+        if not 1 <= int(index) <= lanes:
             raise ValueError(
-                f"Indexes are 1 to {planned_lane_count}, entered {index}"
+                f"Indexes are 1 to {lanes}, entered {index}"
             )
     except ValueError as e:
         print(f"Invalid data: {e}, please try again. \n")
@@ -502,46 +1308,109 @@ def validate_index(index):
     return True
 
 
+def default_rows(wksh_name):
+    """
+    Returns how many rows from the top of the worksheet, headings
+    included, options 7 & 8 never delete. planned has one more
+    than the others, the planned figures of the next day,
+    and ROLLUP only keeps its headings.
+    """
+    if wksh_name == ROLLUP:
+        return 1
+    if wksh_name == "planned":
+        return DEFAULT_DAYS + 2
+    return DEFAULT_DAYS + 1
+
+
+@profiler.instrument
 def delete_last_data(wksh, wksh_name):
     """
     For Menu option 7.
     From https://stackoverflow.com/
-    Identifies last row index & deletes data from it.
+    Identifies last row index of the cached worksheet to delete data from.
+    Returns the first & last rows to delete, or None,
+    and messages to be printed.
     """
-    last_row = len(wksh.col_values(1))
+    last_row = wksh.synced().row_count()
 
-    dflt_rows = 7
-
-    if wksh == PLANNED:
-        dflt_rows = 8
-
-    if last_row > dflt_rows:
-        print(f"Deleting from {wksh_name} worksheet...")
-        wksh.delete_rows(last_row)
-        print(f"Deleting from {wksh_name} worksheet has been completed!\n")
-    else:
-        print(f"All non-default data from {wksh_name} already deleted.\n")
+    if last_row > default_rows(wksh_name):
+        return (last_row, last_row), [
+            f"Deleting from {wksh_name} worksheet...",
+            f"Deleting from {wksh_name} worksheet has been completed!\n"
+        ]
+    return None, [f"All non-default data from {wksh_name} already deleted.\n"]
 
 
+@profiler.instrument
 def delete_all_data(wksh, wksh_name):
     """
     For Menu option 8.
     From https://stackoverflow.com
-    Deletes all data from whsh and adds blank rows.
+    Identifies rows of all non-default data of the cached worksheet.
+    Returns the first & last rows to delete, or None,
+    and messages to be printed.
     """
-    last_row = len(wksh.col_values(1))
+    last_row = wksh.synced().row_count()
+    dflt_rows = default_rows(wksh_name)
 
-    dflt_rows = 7
+    if last_row > dflt_rows:
+        return (dflt_rows + 1, last_row), [
+            f"Deleting ALL non-default data from {wksh_name}...",
+            f"ALL non-default data deleted from {wksh_name} now"
+        ]
+    return None, [f"All non-default data from {wksh_name} already deleted.\n"]
 
-    if wksh == PLANNED:
-        dflt_rows = 8
 
-    if last_row > dflt_rows:
-        wksh.delete_rows(dflt_rows + 1, last_row)
-        print(f"Deleting ALL non-default data from {wksh_name}...")
-        print(f"ALL non-default data deleted from {wksh_name} now")
-    else:
-        print(f"All non-default data from {wksh_name} already deleted.\n")
+@profiler.instrument
+def delete_from_worksheets(delete_data, names=WORKSHEETS):
+    """
+    For Menu options 7 & 8.
+    Finds the rows delete_data deletes from each of the worksheets,
+    the 3 daily ones by default, deletes all of them in one
+    all-or-nothing request and prints their messages in their order.
+    """
+    deletes = {}
+    messages = []
+    for name in names:
+        rows, name_messages = delete_data(get_worksheet(name), name)
+        if rows is not None:
+            deletes[name] = rows
+        messages.extend(name_messages)
+    if deletes:
+        delete_rows(deletes)
+    for message in messages:
+        print(message)
+
+
+@profiler.instrument
+def compact_history(retention_days=RETENTION_DAYS):
+    """
+    Moves whole periods of the oldest days out of the 3 worksheets,
+    keeping at least retention_days and the days the FORECAST_MODEL
+    needs, and appends their unused trailers per lane to the ROLLUP
+    worksheet, all in one all-or-nothing request. The ROLLUP worksheet
+    is added the first time. Returns how many days were moved.
+    """
+    with storage_lock(STORAGE.get()):
+        lanes = headings("added_unused")
+        rows = history("added_unused")
+        keep = max(
+            retention_days, DEFAULT_DAYS,
+            forecast.history_window(FORECAST_MODEL) or 0
+        )
+        days = max(len(rows) - keep, 0) // PERIOD_DAYS * PERIOD_DAYS
+        if not days:
+            return 0
+        if ROLLUP not in worksheet_names():
+            add_worksheet(ROLLUP, [lanes])
+        periods = unused_periods(rows[:days])
+        columns = [lanes.index(lane) for lane in headings(ROLLUP)]
+        append_and_delete_rows(
+            {ROLLUP: periods[:, columns].tolist()},
+            {name: (2, days + 1) for name in day_worksheets()}
+        )
+    print(f"{days} days compacted into the {ROLLUP} worksheet.\n")
+    return days
 
 
 def main():
@@ -552,30 +1421,32 @@ def main():
     while True:
         logo()
         menu()
+        print_journal_status()
 
         option = input("Please choose an option:\n")
+        SCHEDULER.start(f"Option {option}")
 
         if option == "1":
             print("Last time the following numbers of trailers were loaded:")
-            print(last_loaded_values)
+            print(get_last_loaded_values(get_last_loaded()))
         elif option == "2":
             print("Please ensure to pre-order trailers for next loading:")
-            print(last_planned_values)
+            print(get_last_planned_values(get_last_planned()))
         elif option == "3":
             print("For last ops we unused or ordered at the day:\n")
             print("- Positive number: unused trailers.\n")
             print("- 0 indicates that was no trailers addded or unused.\n")
             print("- Negative number: trailers ordered during ops.\n")
-            print(last_added_unused_values)
+            last_added_unused_data = get_last_added_unused()
+            print(get_last_added_unused_values(last_added_unused_data))
         elif option == "4":
             unused_haulage_costs()
         elif option == "5":
             lane_names()
             lane = request_new_lane()
-            lanes = PLANNED.row_values(1)
 
             if lane != "":
-                if lane not in lanes:
+                if not has_lane(lane):
                     add_lane(lane)
                     print("Closing program...")
                     print("Program closed!")
@@ -588,10 +1459,7 @@ def main():
                 print("Enter at least one character for name/code of the lane")
                 print("Return to menu and choose an option again")
         elif option == "6":
-            # From https://docs.gspread.org/en/latest/user-guide.html
-            second_lane = PLANNED.cell(1, 2).value
-
-            if second_lane is not None:
+            if planned_lane_count() > 1:
                 lane_names()
                 delete_lane()
                 break
@@ -603,9 +1471,9 @@ def main():
             cfrm_del_rec = input("Confirm deleting LAST: yes(y) / no(n)\n")
 
             if cfrm_del_rec == "yes" or cfrm_del_rec == "y":
-                delete_last_data(LOADED, "loaded")
-                delete_last_data(PLANNED, "planned")
-                delete_last_data(ADDED_UNUSED, "added_unused")
+                delete_from_worksheets(delete_last_data, day_worksheets())
+                clear_state(get_backend().key, "rolling")
+                clear_state(get_backend().key, "unused")
                 print("Closing program...")
                 print("Program closed!")
                 break
@@ -620,9 +1488,10 @@ def main():
             cfm_del_all = input("Confirm deleting ALL: yes(y) / no(n)\n")
 
             if cfm_del_all == "yes" or cfm_del_all == "y":
-                delete_all_data(LOADED, "loaded")
-                delete_all_data(PLANNED, "planned")
-                delete_all_data(ADDED_UNUSED, "added_unused")
+                # Compacted days go too, the first days kept are default
+                delete_from_worksheets(delete_all_data, worksheet_names())
+                clear_state(get_backend().key, "rolling")
+                clear_state(get_backend().key, "unused")
                 print("Closing program...")
                 print("Program closed!")
                 break
@@ -649,4 +1518,210 @@ def main():
         input("Press enter to return to the menu\n")
 
 
-main()
+def parse_args():
+    """
+    Parses command line options of the program.
+    Without any options the interactive menu is run.
+    """
+    parser = argparse.ArgumentParser(description="Trailers Demand Planner")
+    parser.add_argument(
+        "--ingest", metavar="CSV",
+        help="save many days of loaded data from a CSV file ('-' for stdin)"
+    )
+    parser.add_argument(
+        "--chunk-days", type=int, default=INGEST_CHUNK_DAYS,
+        help="days saved by --ingest or read by --export in one request"
+    )
+    parser.add_argument(
+        "--export", metavar="PATH",
+        help="export the history as one record per lane and day "
+             "('-' for stdout)"
+    )
+    parser.add_argument(
+        "--format", choices=["csv", "jsonl"], default="csv",
+        help="format of --export: CSV or JSON Lines"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="print time, requests and bytes of the hot paths on exit"
+    )
+    parser.add_argument(
+        "--profile-json", metavar="PATH",
+        help="save time, requests and bytes of the hot paths as JSON on exit"
+    )
+    parser.add_argument(
+        "--add-lanes", nargs="+", metavar="LANE",
+        help="add lanes to all worksheets in one request"
+    )
+    parser.add_argument(
+        "--delete-lanes", nargs="+", metavar="LANE",
+        help="delete lanes by name from all worksheets in one request"
+    )
+    parser.add_argument(
+        "--compact", type=int, metavar="DAYS",
+        help="compact days older than the last DAYS into rollups"
+    )
+    parser.add_argument(
+        "--query", nargs=2, metavar=("START", "END"),
+        help="summarize each lane over the ISO dates START to END"
+    )
+    parser.add_argument(
+        "--journal", nargs="?", const="show",
+        choices=["show", "retry", "discard"],
+        help="show journaled writes, send rejected ones again "
+             "or discard them"
+    )
+    parser.add_argument(
+        "--rename-lane", nargs=2, metavar=("LANE", "NEW_LANE"),
+        help="rename a lane in all worksheets"
+    )
+    return parser.parse_args()
+
+
+def manage_lanes(args):
+    """
+    For the lane options of the command line.
+    Adds, deletes or renames lanes by name as asked.
+    Returns True if it was done, False if a lane name was invalid.
+    """
+    try:
+        if args.add_lanes:
+            add_lanes(args.add_lanes)
+            print(f"Lanes added: {', '.join(args.add_lanes)}")
+        if args.delete_lanes:
+            if len(set(args.delete_lanes)) >= planned_lane_count():
+                raise ValueError("at least one lane must remain")
+            delete_lanes(args.delete_lanes)
+            print(f"Lanes deleted: {', '.join(args.delete_lanes)}")
+        if args.rename_lane:
+            rename_lane(*args.rename_lane)
+            print(f"Lane renamed: {' -> '.join(args.rename_lane)}")
+    except ValueError as e:
+        print(f"Invalid data: {e}")
+        return False
+    return True
+
+
+def print_journal():
+    """
+    Prints the journaled writes not saved to the worksheets yet.
+    """
+    journal = get_journal()
+    entries = journal.pending() if journal else []
+    if not entries:
+        print("All writes are saved to the worksheets.")
+        return
+    print("Journaled writes:")
+    for entry in entries:
+        error = journal.error(entry["seq"])
+        print(f"- {entry['seq']} {entry['method']} to "
+              f"{', '.join(worksheets_of(entry))}: "
+              f"{'rejected, ' + error if error else 'waiting'}")
+
+
+def manage_journal(action):
+    """
+    For the journal option of the command line.
+    Shows the journaled writes, sends the rejected ones again or
+    discards them, with the writes after them. The cached worksheets
+    & derived states are then rebuilt from the worksheets.
+    """
+    journal = get_journal()
+    if action == "retry" and journal and journal.retry():
+        print("Sending rejected writes again...")
+        journal.wait()
+    elif action == "discard" and journal:
+        discarded = journal.discard()
+        if discarded:
+            key = get_backend().key
+            for name in worksheet_names():
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(get_worksheet(name).path(key))
+            clear_state(key, "rolling")
+            clear_state(key, "unused")
+            print(f"{discarded} write(s) discarded.")
+    print_journal()
+
+
+def print_quota_report():
+    """
+    Prints how much of the requests quota each menu option used.
+    """
+    lines = SCHEDULER.report()
+    if lines:
+        print("Requests quota used:")
+        for line in lines:
+            print(f"- {line}")
+
+
+def report_profile(args):
+    """
+    Prints or saves what the hot paths cost, as asked on the command line.
+    The report is printed to stderr if the export is written to stdout.
+    """
+    if args.profile:
+        out = sys.stderr if args.export == "-" else sys.stdout
+        with contextlib.redirect_stdout(out):
+            print("Profile:")
+            profiler.print_report()
+    if args.profile_json:
+        profiler.save_report(args.profile_json)
+
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    if ARGS.profile or ARGS.profile_json:
+        # Reported on any exit, including errors and sys.exit()
+        profiler.enable()
+        atexit.register(report_profile, ARGS)
+    if ARGS.ingest:
+        SCHEDULER.start("Ingest")
+        if ARGS.ingest == "-":
+            COMPLETED = ingest_loaded_data(sys.stdin, ARGS.chunk_days)
+        else:
+            with open(ARGS.ingest, newline="", encoding="utf8") as csv_file:
+                COMPLETED = ingest_loaded_data(csv_file, ARGS.chunk_days)
+        print_quota_report()
+        sys.exit(not COMPLETED)
+    elif ARGS.export:
+        SCHEDULER.start("Export")
+        if ARGS.export == "-":
+            DAYS = export_history(sys.stdout, ARGS.format, ARGS.chunk_days)
+        else:
+            with open(ARGS.export, "w", newline="",
+                      encoding="utf8") as export_file:
+                DAYS = export_history(export_file, ARGS.format,
+                                      ARGS.chunk_days)
+        # Messages go to stderr, stdout may be the export itself
+        with contextlib.redirect_stdout(sys.stderr):
+            print(f"{DAYS} days exported.")
+            print_quota_report()
+    elif ARGS.journal:
+        SCHEDULER.start("Journal")
+        manage_journal(ARGS.journal)
+        print_quota_report()
+    elif ARGS.compact is not None:
+        SCHEDULER.start("Compact")
+        if not compact_history(ARGS.compact):
+            print("No whole period of days to compact.")
+        print_quota_report()
+    elif ARGS.query:
+        SCHEDULER.start("Query")
+        try:
+            DATE_RANGE = [parse_date(text) for text in ARGS.query]
+        except ValueError as e:
+            print(f"Invalid date: {e}")
+            sys.exit(1)
+        if DATE_RANGE[0] > DATE_RANGE[1]:
+            print(f"Invalid dates: {ARGS.query[0]} is after {ARGS.query[1]}")
+            sys.exit(1)
+        print_range_summary(*DATE_RANGE)
+        print_quota_report()
+    elif ARGS.add_lanes or ARGS.delete_lanes or ARGS.rename_lane:
+        SCHEDULER.start("Lanes")
+        COMPLETED = manage_lanes(ARGS)
+        print_quota_report()
+        sys.exit(not COMPLETED)
+    else:
+        main()
+        print_quota_report()
@@ -0,0 +1,204 @@
+"""
+Quota-aware request scheduler for the Trailers Demand Planner.
+Every request to the storage backend takes a token from a token bucket
+refilled at the Sheets API per-minute quota, failed requests that were
+not applied (e.g. 429 Too Many Requests) are sent again after a jittered
+exponential backoff.
+Requests are counted per menu option to report how much quota it used,
+under the label and in the counters of the thread that sent them.
+"""
+import contextvars
+import os
+import random
+import threading
+import time
+
+import profiler
+from storage import Backend
+
+# Sheets API allows 60 read and 60 write requests per minute per user
+QUOTA_PER_MINUTE = int(os.environ.get("TDP_QUOTA_PER_MINUTE", "60"))
+
+# Sending a failed request again, delays double from BACKOFF_DELAY seconds
+RETRIES = 5
+BACKOFF_DELAY = 1.0
+MAX_BACKOFF_DELAY = 32.0
+
+# Label of the requests sent from the current thread or session
+LABEL = contextvars.ContextVar("scheduler_label", default="startup")
+
+# Usage counters of the current session, None for those of the process
+USAGE = contextvars.ContextVar("scheduler_usage", default=None)
+
+
+class Scheduler:
+    """
+    Token bucket with retries and per-label usage counters.
+    The bucket holds up to one minute of quota and a request
+    that finds it empty waits until its token has been refilled.
+    The bucket is shared by all threads, while each thread counts its
+    requests under its own label, in the counters of its session if
+    it started one and otherwise in those of the process.
+    """
+
+    def __init__(self, per_minute=QUOTA_PER_MINUTE):
+        self.per_minute = per_minute
+        self.rate = per_minute / 60
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.usage = {}
+
+    def acquire(self):
+        """
+        Takes a token, waiting for it if the bucket is empty.
+        Returns the seconds waited.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.per_minute,
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Taking the token before waiting reserves it for this request
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def record(self, requests=0, retries=0, waited=0.0):
+        """
+        Adds to the usage counters of the current label.
+        """
+        with self.lock:
+            usage = self.counters().setdefault(
+                LABEL.get(), {"requests": 0, "retries": 0, "waited": 0.0}
+            )
+            usage["requests"] += requests
+            usage["retries"] += retries
+            usage["waited"] += waited
+
+    def call(self, function, is_retryable, *args):
+        """
+        Sends a request within the quota and returns its result.
+        Requests that fail with an error is_retryable accepts are sent
+        again up to RETRIES times after a jittered exponential backoff.
+        """
+        for attempt in range(RETRIES + 1):
+            self.record(requests=1, waited=self.acquire())
+            try:
+                return function(*args)
+            except Exception as error:
+                if attempt == RETRIES or not is_retryable(error):
+                    raise
+                delay = min(MAX_BACKOFF_DELAY, BACKOFF_DELAY * 2 ** attempt)
+                delay = delay / 2 + random.uniform(0, delay / 2)
+                self.record(retries=1, waited=delay)
+                time.sleep(delay)
+
+    def start(self, label):
+        """
+        Counts the next requests of the current thread under the label.
+        """
+        LABEL.set(label)
+
+    def start_session(self):
+        """
+        Counts the requests of the current thread, e.g. serving a session,
+        apart from those of other threads, starting from none.
+        """
+        USAGE.set({})
+        LABEL.set("startup")
+
+    def counters(self):
+        """
+        Returns the usage counters of the current session, or process.
+        """
+        usage = USAGE.get()
+        return self.usage if usage is None else usage
+
+    def report(self):
+        """
+        Returns a line about the quota used under each label,
+        in the current session or process.
+        """
+        lines = []
+        with self.lock:
+            counters = dict(self.counters())
+        for label, usage in counters.items():
+            share = round(usage["requests"] / self.per_minute * 100)
+            lines.append(
+                f"{label}: {usage['requests']} request(s) "
+                f"({share}% of {self.per_minute} per minute quota), "
+                f"{usage['retries']} retries, "
+                f"waited {usage['waited']:.1f}s"
+            )
+        return lines
+
+
+class ScheduledBackend(Backend):
+    """
+    Sends all requests of a backend through the scheduler.
+    """
+
+    def __init__(self, backend, scheduler):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.key = backend.key
+
+    def send(self, function, *args):
+        """
+        Sends a request of the backend through the scheduler.
+        """
+        if not profiler.ENABLED:
+            return self.scheduler.call(
+                function, self.backend.is_retryable, *args
+            )
+        started = time.perf_counter()
+        result = self.scheduler.call(
+            function, self.backend.is_retryable, *args
+        )
+        profiler.record_request(time.perf_counter() - started, args, result)
+        return result
+
+    def read_all(self, names):
+        return self.send(self.backend.read_all, names)
+
+    def read_tails(self, tails):
+        return self.send(self.backend.read_tails, tails)
+
+    def read_spans(self, spans):
+        return self.send(self.backend.read_spans, spans)
+
+    def append_rows(self, rows):
+        return self.send(self.backend.append_rows, rows)
+
+    def write_cells(self, updates):
+        return self.send(self.backend.write_cells, updates)
+
+    def append_and_delete(self, rows, deletes):
+        return self.send(self.backend.append_and_delete, rows, deletes)
+
+    def apply_writes(self, writes, mark):
+        # Only sent by the journal flusher thread, counted apart
+        self.scheduler.start("Journal")
+        return self.send(self.backend.apply_writes, writes, mark)
+
+    def applied_mark(self):
+        self.scheduler.start("Journal")
+        return self.send(self.backend.applied_mark)
+
+    def has_worksheet(self, name):
+        # Answered from metadata the backend has when it is opened
+        return self.backend.has_worksheet(name)
+
+    def add_worksheet(self, name, rows):
+        return self.send(self.backend.add_worksheet, name, rows)
+
+    def delete_dimensions(self, deletes):
+        return self.send(self.backend.delete_dimensions, deletes)
+
+    def is_retryable(self, error):
+        return self.backend.is_retryable(error)
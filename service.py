@@ -0,0 +1,97 @@
+"""
+Planner service of the Trailers Demand Planner.
+A long-lived process that authorizes the client, opens the spreadsheet
+with its metadata and syncs the cached worksheets once, then
+runs the menu of each terminal session (session.py) connecting to its
+Unix socket in a thread of its own. All sessions share the warm client,
+the cached worksheets and the requests quota, and the cache is kept
+in sync by the delta sync every CACHE_TTL seconds.
+Usage: python3 service.py
+"""
+import contextlib
+import os
+import socket
+import sys
+import threading
+import traceback
+
+import run
+from session import SOCKET_PATH
+from streams import ThreadStream
+
+
+def warm_up():
+    """
+    Authorizes the client, opens the spreadsheet, loads its metadata
+    and syncs the cached worksheets before the first session.
+    """
+    run.refresh_cache()
+    backend = run.get_backend()
+    while hasattr(backend, "backend"):
+        backend = backend.backend
+    if hasattr(backend, "metadata"):
+        backend.metadata()
+
+
+def serve_session(connection):
+    """
+    Runs the menu for one session, reading what is typed
+    and printing to the session's connection, and at its end the
+    requests quota the session used.
+    """
+    reader = connection.makefile("r", encoding="utf8")
+    writer = connection.makefile("w", encoding="utf8", buffering=1)
+    sys.stdin.bind(reader)
+    sys.stdout.bind(writer)
+    run.SCHEDULER.start_session()
+    try:
+        run.main()
+        run.print_quota_report()
+    except (EOFError, OSError):
+        # The session was closed in the middle of the menu
+        pass
+    except Exception:
+        traceback.print_exc(file=sys.__stderr__)
+        print("Something went wrong, please start the session again.")
+    finally:
+        sys.stdin.unbind()
+        sys.stdout.unbind()
+        for stream in (reader, writer, connection):
+            with contextlib.suppress(OSError):
+                stream.close()
+
+
+def listen(path=SOCKET_PATH):
+    """
+    Accepts sessions on the Unix socket until the service is stopped.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    print(f"Planner service listening on {path}")
+    try:
+        while True:
+            connection, _ = server.accept()
+            threading.Thread(
+                target=serve_session, args=(connection,), daemon=True
+            ).start()
+    finally:
+        server.close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    sys.stdin = ThreadStream(sys.stdin)
+    sys.stdout = ThreadStream(sys.stdout)
+    try:
+        warm_up()
+    except Exception as error:
+        # The first session warms up instead, e.g. once creds.json exists
+        print(f"Warming up failed: {error}")
+    try:
+        listen()
+    except KeyboardInterrupt:
+        print("Planner service stopped")
@@ -0,0 +1,59 @@
+"""
+Terminal session of the Trailers Demand Planner.
+Connects the terminal to the planner service (service.py), which keeps
+the authorized client and the cached worksheets warm between sessions,
+so a session starts without authorizing or reading the worksheets.
+If no service is running the planner is run in this process instead.
+Only light modules are imported, so the session itself starts fast.
+Usage: python3 session.py
+"""
+import os
+import socket
+import sys
+import threading
+
+from localstate import STATE_DIR
+
+# Unix socket the planner service listens on
+SOCKET_PATH = os.environ.get(
+    "TDP_SOCKET", os.path.join(STATE_DIR, "planner.sock")
+)
+
+
+def send_input(connection):
+    """
+    Sends what is typed in the terminal to the service.
+    """
+    while True:
+        data = os.read(sys.stdin.fileno(), 4096)
+        if not data:
+            connection.shutdown(socket.SHUT_WR)
+            return
+        connection.sendall(data)
+
+
+def main():
+    """
+    Relays the terminal to the service until it ends the session.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(SOCKET_PATH)
+    except OSError:
+        run_path = os.path.join(os.path.dirname(__file__), "run.py")
+        os.execv(sys.executable, [sys.executable, run_path] + sys.argv[1:])
+
+    threading.Thread(
+        target=send_input, args=(connection,), daemon=True
+    ).start()
+    with connection:
+        while True:
+            data = connection.recv(4096)
+            if not data:
+                break
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,883 @@
+"""
+Storage backends for the Trailers Demand Planner.
+The planner works on three worksheets (loaded, planned & added_unused)
+kept as grids of strings with lane names in the first row.
+GspreadBackend keeps them in the Google Sheet, SqliteBackend keeps them
+in a local SQLite database file for offline runs and benchmarks.
+"""
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache, wraps
+
+import gspread
+from google.oauth2.service_account import Credentials
+from gspread.utils import rowcol_to_a1
+
+import localstate
+import profiler
+
+SCOPE = [
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+    "https://www.googleapis.com/auth/drive"
+    ]
+
+CREDS_FILE = "creds.json"
+SPREADSHEET_TITLE = "trailers_demand_planner"
+
+# Saved access tokens are only used until this long before they expire
+TOKEN_MARGIN = timedelta(minutes=5)
+
+# Statuses of requests failing on a spreadsheet or worksheet ID that
+# no longer exists, e.g. after the worksheet was deleted and added again
+STALE_METADATA_STATUSES = (400, 404)
+
+# Key of the journal position saved with the data (see journal.py)
+JOURNAL_MARK = "tdp_journal"
+
+
+def pad_rows(rows):
+    """
+    Pads rows to the width of the headings row like get_all_values() does.
+    """
+    width = len(rows[0]) if rows else 0
+    return [row + [""] * (width - len(row)) for row in rows]
+
+
+def apply_cells(rows, row, col, values):
+    """
+    Writes a block of values into rows in place, starting at row & col.
+    Rows are added and widened with empty cells where needed.
+    """
+    for offset, block_row in enumerate(values):
+        while len(rows) < row + offset:
+            rows.append([])
+        cells = rows[row + offset - 1]
+        end = col - 1 + len(block_row)
+        cells.extend([""] * (end - len(cells)))
+        cells[col - 1:end] = [str(value) for value in block_row]
+    width = max(len(cells) for cells in rows) if rows else 0
+    for cells in rows:
+        cells.extend([""] * (width - len(cells)))
+
+
+def cell_data(value):
+    """
+    Returns the Sheets API cell data entering the value as it is,
+    like append_row() does, numbers as numbers and the rest as text.
+    """
+    if isinstance(value, (int, float)):
+        return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+
+def entered_cell_data(value):
+    """
+    Returns the Sheets API cell data entering the value like typing it
+    does, like update_cell() does, so text like "0" is a number too.
+    """
+    if isinstance(value, str) and re.fullmatch(r"-?\d+", value.strip()):
+        return cell_data(int(value))
+    return cell_data(value)
+
+
+def slug(text):
+    """
+    Returns the text with anything but letters, digits & dots replaced.
+    """
+    return re.sub(r"[^A-Za-z0-9.]+", "_", text)
+
+
+def utcnow():
+    """
+    Returns the current UTC time without time zone, like token expiries.
+    """
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class CachedCredentials(Credentials):
+    """
+    Service account credentials saving the access token in a local
+    state file whenever it is refreshed, so that new sessions reuse it
+    instead of fetching a new one until it nearly expires.
+    """
+
+    _save_lock = threading.Lock()
+
+    def token_key(self):
+        """
+        Returns the state file key of the service account's token.
+        """
+        return "oauth_" + slug(self.service_account_email)
+
+    def load_token(self):
+        """
+        Uses the saved access token if it has the same scopes and is
+        valid for longer than TOKEN_MARGIN.
+        """
+        state = localstate.load_state(self.token_key(), "token")
+        if not state or state.get("scopes") != list(self.scopes or []):
+            return
+        expiry = datetime.fromisoformat(state["expiry"])
+        if expiry - TOKEN_MARGIN > utcnow():
+            self.token = state["token"]
+            self.expiry = expiry
+
+    def refresh(self, request):
+        super().refresh(request)
+        state = {
+            "token": self.token,
+            "expiry": self.expiry.isoformat(),
+            "scopes": list(self.scopes or []),
+        }
+        with self._save_lock:
+            try:
+                localstate.save_state(
+                    self.token_key(), "token", state, private=True
+                )
+            except OSError:
+                # Only the next session fetches a token again
+                pass
+
+
+class OpenedSpreadsheet(gspread.Spreadsheet):
+    """
+    Spreadsheet opened by its ID without fetching its metadata,
+    which GspreadBackend keeps in a local state file instead.
+    """
+
+    def __init__(self, client, properties):
+        # pylint: disable=super-init-not-called
+        self.client = client
+        self._properties = properties
+
+
+@lru_cache(maxsize=None)
+def get_client(creds_file):
+    """
+    Authorizes a gspread client with the credentials file, once,
+    with the access token saved by an earlier session if still valid.
+    """
+    creds = CachedCredentials.from_service_account_file(
+        creds_file, scopes=SCOPE
+    )
+    creds.load_token()
+    return gspread.authorize(creds)
+
+
+def revalidated(method):
+    """
+    Sends the request of a GspreadBackend method once more with the
+    metadata fetched anew, if it failed on an ID of the metadata
+    saved by an earlier session.
+    """
+    @wraps(method)
+    def wrapper(self, *args):
+        try:
+            return method(self, *args)
+        except gspread.exceptions.APIError as error:
+            status = error.response.status_code
+            if (not self.metadata_saved
+                    or status not in STALE_METADATA_STATUSES):
+                raise
+        self.revalidate()
+        return method(self, *args)
+    return wrapper
+
+
+class Backend:
+    """
+    Operations the planner uses on its worksheets.
+    Rows and columns are numbered from 1 like in gspread.
+    The key tells apart spreadsheets or databases in local state files.
+    """
+
+    key = ""
+
+    def read_all(self, names):
+        """
+        Returns a dict with all rows of each worksheet, headings first.
+        """
+        raise NotImplementedError
+
+    def read_tails(self, tails):
+        """
+        Returns a dict with the headings row and the rows from a given
+        row on of each worksheet, read in one request.
+        Tails is a dict of worksheet name to (first row, width),
+        the rows are read width cells wide.
+        """
+        return {
+            name: (rows[0] if rows else [], rows[tails[name][0] - 1:])
+            for name, rows in self.read_all(list(tails)).items()
+        }
+
+    def read_spans(self, spans):
+        """
+        Returns a dict with the rows of a span of each worksheet, read in
+        one request. Spans is a dict of worksheet name to (first row,
+        last row), rows past the last one of a worksheet are left out.
+        """
+        return {
+            name: rows[spans[name][0] - 1:spans[name][1]]
+            for name, rows in self.read_all(list(spans)).items()
+        }
+
+    def append_rows(self, rows):
+        """
+        Appends rows below the last row of each worksheet in one request.
+        Rows is a dict of worksheet name to the list of rows to append.
+        Either all rows are appended or, if the request fails, none.
+        """
+        raise NotImplementedError
+
+    def write_cells(self, updates):
+        """
+        Writes blocks of values in one request.
+        Updates are (worksheet name, row, col, list of rows) tuples,
+        each block starting at the given row & col.
+        """
+        raise NotImplementedError
+
+    def delete_dimensions(self, deletes):
+        """
+        Deletes rows or columns in one request, applied in order.
+        Deletes are (worksheet name, "ROWS" or "COLUMNS", start, end)
+        tuples, start to end inclusive.
+        """
+        raise NotImplementedError
+
+    def append_and_delete(self, rows, deletes):
+        """
+        Appends rows like append_rows() and then deletes rows or columns
+        like delete_dimensions(), all in one all-or-nothing request.
+        """
+        raise NotImplementedError
+
+    def apply_writes(self, writes, mark):
+        """
+        Applies writes in one all-or-nothing request together with the
+        mark, the journal position they reach, which applied_mark()
+        returns from then on. Writes are (method, args) pairs of
+        append_rows, write_cells, delete_dimensions & append_and_delete,
+        applied in order.
+        """
+        raise NotImplementedError
+
+    def applied_mark(self):
+        """
+        Returns the journal position saved by apply_writes(), 0 if none.
+        """
+        raise NotImplementedError
+
+    def has_worksheet(self, name):
+        """
+        Checks if the worksheet exists.
+        """
+        raise NotImplementedError
+
+    def add_worksheet(self, name, rows):
+        """
+        Adds a worksheet with the rows, headings first, in one request.
+        """
+        raise NotImplementedError
+
+    def delete_columns(self, name, start, end):
+        """
+        Deletes columns from start to end (inclusive) of the worksheet.
+        """
+        self.delete_dimensions([(name, "COLUMNS", start, end)])
+
+    def delete_rows(self, name, start, end):
+        """
+        Deletes rows from start to end (inclusive) of the worksheet.
+        """
+        self.delete_dimensions([(name, "ROWS", start, end)])
+
+    def is_retryable(self, error):
+        """
+        Checks if a failed request was not applied and can be sent again.
+        """
+        return False
+
+
+class GspreadBackend(Backend):
+    """
+    Keeps the worksheets in the Google Sheet through gspread.
+    The client is authorized and the spreadsheet opened on first use,
+    unless an already opened spreadsheet is given.
+    The spreadsheet ID and the ID & grid size of each worksheet are
+    saved as metadata in a local state file, so later sessions open the
+    spreadsheet without looking it up by title or fetching its metadata.
+    Saved metadata is only fetched again when a request fails on it.
+    """
+
+    def __init__(self, title=SPREADSHEET_TITLE, creds_file=CREDS_FILE,
+                 spreadsheet=None):
+        self.title = title
+        self.creds_file = creds_file
+        self.key = "gsheets_" + slug(title)
+        self._given = spreadsheet
+        self._spreadsheet = spreadsheet
+        self._metadata = None
+        self.metadata_saved = False
+        # Whether the journal mark exists, None until it is looked up
+        self.mark_saved = None
+        # Metadata is fetched once even if requested from several threads
+        self._lock = threading.RLock()
+
+    @property
+    def spreadsheet(self):
+        """
+        Authorizes the client and opens the spreadsheet the first time.
+        """
+        with self._lock:
+            if self._spreadsheet is None:
+                self._spreadsheet = self.authorize()
+            return self._spreadsheet
+
+    @profiler.instrument
+    def authorize(self):
+        """
+        Returns the spreadsheet opened by the ID in the metadata,
+        with the client authorized once for all spreadsheets opened
+        with the same credentials.
+        """
+        metadata = self.metadata()
+        if self._spreadsheet is not None:
+            # Opened while fetching the metadata
+            return self._spreadsheet
+        return OpenedSpreadsheet(
+            get_client(self.creds_file),
+            {"id": metadata["id"], "title": self.title}
+        )
+
+    def metadata(self):
+        """
+        Returns the saved metadata, fetching it the first time
+        if there is none or it is of another spreadsheet.
+        """
+        with self._lock:
+            if self._metadata is None:
+                saved = localstate.load_state(self.key, "metadata")
+                if saved and (self._given is None
+                              or saved["id"] == self._given.id):
+                    self._metadata = saved
+                    self.metadata_saved = True
+                else:
+                    self._metadata = self.fetch_metadata()
+            return self._metadata
+
+    def fetch_metadata(self):
+        """
+        Looks up the spreadsheet by title, unless it is given, and
+        fetches the ID & grid size of its worksheets in one request.
+        Returns the metadata after saving it.
+        Raise gspread.SpreadsheetNotFound if there is no such spreadsheet.
+        """
+        if self._spreadsheet is None:
+            client = get_client(self.creds_file)
+            for found in client.list_spreadsheet_files(self.title):
+                if found["name"] == self.title:
+                    self._spreadsheet = OpenedSpreadsheet(
+                        client, {"id": found["id"], "title": self.title}
+                    )
+                    break
+            else:
+                raise gspread.SpreadsheetNotFound(self.title)
+        metadata = {
+            "id": self._spreadsheet.id,
+            "worksheets": {
+                wksh.title: {
+                    "id": wksh.id,
+                    "rows": wksh.row_count,
+                    "cols": wksh.col_count,
+                }
+                for wksh in self._spreadsheet.worksheets()
+            },
+        }
+        localstate.save_state(self.key, "metadata", metadata)
+        self.metadata_saved = False
+        return metadata
+
+    def revalidate(self):
+        """
+        Drops the saved metadata and fetches it again, looking the
+        spreadsheet up by title again unless it is given.
+        """
+        with self._lock:
+            localstate.clear_state(self.key, "metadata")
+            self._spreadsheet = self._given
+            self._metadata = self.fetch_metadata()
+
+    def sheet_id(self, name):
+        """
+        Returns the ID of the worksheet from the metadata.
+        Raise gspread.WorksheetNotFound if there is no such worksheet.
+        """
+        with self._lock:
+            worksheets = self.metadata()["worksheets"]
+            if name not in worksheets and self.metadata_saved:
+                self.revalidate()
+                worksheets = self._metadata["worksheets"]
+            if name not in worksheets:
+                raise gspread.WorksheetNotFound(name)
+            return worksheets[name]["id"]
+
+    @revalidated
+    def read_all(self, names):
+        response = self.spreadsheet.values_batch_get(names)
+        value_ranges = response["valueRanges"]
+        return {
+            name: pad_rows(value_range.get("values", []))
+            for name, value_range in zip(names, value_ranges)
+        }
+
+    @revalidated
+    def read_tails(self, tails):
+        ranges = []
+        for name, (first, width) in tails.items():
+            last_col = rowcol_to_a1(1, width)[:-1]
+            ranges += [f"'{name}'!1:1", f"'{name}'!A{first}:{last_col}"]
+        response = self.spreadsheet.values_batch_get(ranges)
+        value_ranges = response["valueRanges"]
+        return {
+            name: (
+                value_ranges[2 * number].get("values", [[]])[0],
+                value_ranges[2 * number + 1].get("values", [])
+            )
+            for number, name in enumerate(tails)
+        }
+
+    @revalidated
+    def read_spans(self, spans):
+        response = self.spreadsheet.values_batch_get([
+            f"'{name}'!{first}:{last}" for name, (first, last) in spans.items()
+        ])
+        return {
+            name: value_range.get("values", [])
+            for name, value_range in zip(spans, response["valueRanges"])
+        }
+
+    def append_requests(self, rows):
+        """
+        Returns the batchUpdate requests appending rows.
+        """
+        return [
+            {"appendCells": {
+                "sheetId": self.sheet_id(name),
+                "rows": [
+                    {"values": [cell_data(value) for value in row]}
+                    for row in name_rows
+                ],
+                "fields": "userEnteredValue"
+            }}
+            for name, name_rows in rows.items()
+        ]
+
+    def delete_requests(self, deletes):
+        """
+        Returns the batchUpdate requests deleting rows or columns.
+        """
+        return [
+            {"deleteDimension": {"range": {
+                "sheetId": self.sheet_id(name),
+                "dimension": dimension,
+                "startIndex": start - 1,
+                "endIndex": end
+            }}}
+            for name, dimension, start, end in deletes
+        ]
+
+    def update_requests(self, updates):
+        """
+        Returns the batchUpdate requests writing blocks of values,
+        entered like write_cells() enters them.
+        """
+        return [
+            {"updateCells": {
+                "start": {
+                    "sheetId": self.sheet_id(name),
+                    "rowIndex": row - 1,
+                    "columnIndex": col - 1
+                },
+                "rows": [
+                    {"values": [entered_cell_data(value) for value in cells]}
+                    for cells in values
+                ],
+                "fields": "userEnteredValue"
+            }}
+            for name, row, col, values in updates
+        ]
+
+    def mark_request(self, mark):
+        """
+        Returns the batchUpdate request saving the journal mark
+        as developer metadata of the spreadsheet.
+        """
+        if not self.mark_saved:
+            return {"createDeveloperMetadata": {"developerMetadata": {
+                "metadataKey": JOURNAL_MARK,
+                "metadataValue": str(mark),
+                "location": {"spreadsheet": True},
+                "visibility": "DOCUMENT"
+            }}}
+        return {"updateDeveloperMetadata": {
+            "dataFilters": [{"developerMetadataLookup": {
+                "metadataKey": JOURNAL_MARK
+            }}],
+            "developerMetadata": {"metadataValue": str(mark)},
+            "fields": "metadataValue"
+        }}
+
+    @revalidated
+    def append_rows(self, rows):
+        # A single batchUpdate request is applied by the API atomically
+        self.spreadsheet.batch_update(
+            {"requests": self.append_requests(rows)}
+        )
+
+    @revalidated
+    def write_cells(self, updates):
+        # Values are entered like update_cell() does, so "0" is a number
+        self.spreadsheet.values_batch_update({
+            "valueInputOption": "USER_ENTERED",
+            "data": [
+                {"range": f"'{name}'!{rowcol_to_a1(row, col)}",
+                 "values": values}
+                for name, row, col, values in updates
+            ]
+        })
+
+    @revalidated
+    def delete_dimensions(self, deletes):
+        self.spreadsheet.batch_update(
+            {"requests": self.delete_requests(deletes)}
+        )
+
+    @revalidated
+    def append_and_delete(self, rows, deletes):
+        self.spreadsheet.batch_update({
+            "requests": (
+                self.append_requests(rows) + self.delete_requests(deletes)
+            )
+        })
+
+    @revalidated
+    def apply_writes(self, writes, mark):
+        if self.mark_saved is None:
+            self.applied_mark()
+        requests = []
+        for method, args in writes:
+            if method in ("append_rows", "append_and_delete"):
+                requests += self.append_requests(args[0])
+            if method == "append_and_delete":
+                requests += self.delete_requests(args[1])
+            elif method == "delete_dimensions":
+                requests += self.delete_requests(args[0])
+            elif method == "write_cells":
+                requests += self.update_requests(args[0])
+        self.spreadsheet.batch_update(
+            {"requests": requests + [self.mark_request(mark)]}
+        )
+        self.mark_saved = True
+
+    def applied_mark(self):
+        response = self.spreadsheet.fetch_sheet_metadata(
+            {"fields": "developerMetadata"}
+        )
+        for metadata in response.get("developerMetadata", []):
+            if metadata["metadataKey"] == JOURNAL_MARK:
+                self.mark_saved = True
+                return int(metadata["metadataValue"])
+        self.mark_saved = False
+        return 0
+
+    def has_worksheet(self, name):
+        return name in self.metadata()["worksheets"]
+
+    @revalidated
+    def add_worksheet(self, name, rows):
+        # The sheet ID is chosen so the rows go in the same request
+        with self._lock:
+            worksheets = self.metadata()["worksheets"]
+            sheet_id = max(
+                [wksh["id"] for wksh in worksheets.values()], default=0
+            ) + 1
+            cols = max(len(row) for row in rows)
+            self.spreadsheet.batch_update({"requests": [
+                {"addSheet": {"properties": {
+                    "sheetId": sheet_id,
+                    "title": name,
+                    "gridProperties": {"rowCount": 1, "columnCount": cols},
+                }}},
+                {"appendCells": {
+                    "sheetId": sheet_id,
+                    "rows": [
+                        {"values": [cell_data(value) for value in row]}
+                        for row in rows
+                    ],
+                    "fields": "userEnteredValue"
+                }},
+            ]})
+            worksheets[name] = {"id": sheet_id, "rows": len(rows),
+                                "cols": cols}
+            localstate.save_state(self.key, "metadata", self._metadata)
+
+    def is_retryable(self, error):
+        # Too many requests & service unavailable are not applied
+        return (
+            isinstance(error, gspread.exceptions.APIError)
+            and error.response.status_code in (429, 503)
+        )
+
+
+class SqliteBackend(Backend):
+    """
+    Keeps the worksheets in a local SQLite database.
+    Each worksheet row is stored as a JSON list of strings
+    numbered from 1, the same way as in the Google Sheet.
+    The connection is shared by all threads, one operation at a time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.key = "sqlite_" + slug(os.path.abspath(path))
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.RLock()
+        with self.transaction():
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " worksheet TEXT NOT NULL,"
+                " number INTEGER NOT NULL,"
+                " cells TEXT NOT NULL,"
+                " PRIMARY KEY (worksheet, number))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS marks ("
+                " name TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL)"
+            )
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the block as one transaction, one thread at a time.
+        """
+        with self.lock, self.connection:
+            yield
+
+    def rows(self, name, first=1, last=None):
+        """
+        Returns rows of the worksheet from first to last (all by default)
+        as lists of strings.
+        """
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT cells FROM rows WHERE worksheet = ?"
+                " AND number >= ? AND (? IS NULL OR number <= ?)"
+                " ORDER BY number",
+                (name, first, last, last)
+            )
+            return [json.loads(cells) for (cells,) in cursor]
+
+    def write_rows(self, name, rows):
+        """
+        Replaces all rows of the worksheet.
+        """
+        with self.transaction():
+            self.replace_rows(name, rows)
+
+    def replace_rows(self, name, rows):
+        """
+        Replaces all rows of the worksheet within the open transaction.
+        """
+        self.connection.execute(
+            "DELETE FROM rows WHERE worksheet = ?", (name,)
+        )
+        self.connection.executemany(
+            "INSERT INTO rows (worksheet, number, cells) VALUES (?, ?, ?)",
+            [
+                (name, number, json.dumps([str(cell) for cell in row]))
+                for number, row in enumerate(rows, 1)
+            ]
+        )
+
+    def read_all(self, names):
+        return {name: pad_rows(self.rows(name)) for name in names}
+
+    def read_tails(self, tails):
+        with self.lock:
+            return {
+                name: (
+                    (self.rows(name, 1, 1) or [[]])[0],
+                    [row[:width] for row in self.rows(name, first)]
+                )
+                for name, (first, width) in tails.items()
+            }
+
+    def read_spans(self, spans):
+        with self.lock:
+            return {
+                name: self.rows(name, first, last)
+                for name, (first, last) in spans.items()
+            }
+
+    def append_rows(self, rows):
+        with self.transaction():
+            self.insert_rows(rows)
+
+    def insert_rows(self, rows):
+        """
+        Appends rows of the worksheets within the open transaction.
+        """
+        for name, name_rows in rows.items():
+            for row in name_rows:
+                self.connection.execute(
+                    "INSERT INTO rows (worksheet, number, cells)"
+                    " SELECT ?, COALESCE(MAX(number), 0) + 1, ?"
+                    " FROM rows WHERE worksheet = ?",
+                    (name, json.dumps([str(cell) for cell in row]), name)
+                )
+
+    def write_cells(self, updates):
+        with self.transaction():
+            self.update_cells(updates)
+
+    def update_cells(self, updates):
+        """
+        Writes blocks of values within the open transaction.
+        """
+        for name, row, col, values in updates:
+            rows = self.rows(name)
+            apply_cells(rows, row, col, values)
+            self.replace_rows(name, rows)
+
+    def delete_dimensions(self, deletes):
+        with self.transaction():
+            self.remove_dimensions(deletes)
+
+    def append_and_delete(self, rows, deletes):
+        with self.transaction():
+            self.insert_rows(rows)
+            self.remove_dimensions(deletes)
+
+    def apply_writes(self, writes, mark):
+        with self.transaction():
+            for method, args in writes:
+                if method in ("append_rows", "append_and_delete"):
+                    self.insert_rows(args[0])
+                if method == "append_and_delete":
+                    self.remove_dimensions(args[1])
+                elif method == "delete_dimensions":
+                    self.remove_dimensions(args[0])
+                elif method == "write_cells":
+                    self.update_cells(args[0])
+            self.connection.execute(
+                "INSERT OR REPLACE INTO marks (name, value) VALUES (?, ?)",
+                (JOURNAL_MARK, mark)
+            )
+
+    def applied_mark(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM marks WHERE name = ?", (JOURNAL_MARK,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def has_worksheet(self, name):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM rows WHERE worksheet = ? LIMIT 1", (name,)
+            ).fetchone() is not None
+
+    def add_worksheet(self, name, rows):
+        self.append_rows({name: rows})
+
+    def remove_dimensions(self, deletes):
+        """
+        Deletes rows or columns within the open transaction.
+        """
+        for name, dimension, start, end in deletes:
+            if dimension == "COLUMNS":
+                self.remove_columns(name, start, end)
+            else:
+                self.remove_rows(name, start, end)
+
+    def remove_columns(self, name, start, end):
+        """
+        Deletes columns of the worksheet within the open transaction.
+        """
+        rows = self.rows(name)
+        for cells in rows:
+            del cells[start - 1:end]
+        self.replace_rows(name, rows)
+
+    def remove_rows(self, name, start, end):
+        """
+        Deletes rows of the worksheet within the open transaction.
+        """
+        # Renumbering goes through negative numbers
+        # so it never collides with rows that are not moved yet
+        self.connection.execute(
+            "DELETE FROM rows WHERE worksheet = ?"
+            " AND number BETWEEN ? AND ?",
+            (name, start, end)
+        )
+        self.connection.execute(
+            "UPDATE rows SET number = -(number - ?)"
+            " WHERE worksheet = ? AND number > ?",
+            (end - start + 1, name, end)
+        )
+        self.connection.execute(
+            "UPDATE rows SET number = -number"
+            " WHERE worksheet = ? AND number < 0",
+            (name,)
+        )
+
+    def is_retryable(self, error):
+        return (
+            isinstance(error, sqlite3.OperationalError)
+            and "locked" in str(error)
+        )
+
+
+def open_backend(storage=""):
+    """
+    Opens the storage backend described by the storage setting:
+    - "" or "gsheets" for the Google Sheet (default)
+    - "gsheets:<title>" for another Google Sheet, e.g. of another depot
+    - "sqlite:<path>" for a local SQLite database file
+    """
+    kind, _, target = storage.partition(":")
+    if kind in ("", "gsheets"):
+        return GspreadBackend(target or SPREADSHEET_TITLE)
+    if kind == "sqlite" and target:
+        return SqliteBackend(target)
+    raise ValueError(f"Unknown storage: {storage}")
+
+
+def copy_worksheets(source, target, names):
+    """
+    Copies all rows of the worksheets from one backend into a SQLite one.
+    """
+    for name, rows in source.read_all(names).items():
+        target.write_rows(name, rows)
+
+
+if __name__ == "__main__":
+    # Usage: python3 storage.py <database file>
+    # Copies the Google Sheet into a local SQLite database
+    SOURCE = GspreadBackend()
+    NAMES = ["loaded", "planned", "added_unused", "dates", "unused_rollup"]
+    copy_worksheets(
+        SOURCE,
+        SqliteBackend(sys.argv[1]),
+        [name for name in NAMES if SOURCE.has_worksheet(name)]
+    )
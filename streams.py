@@ -0,0 +1,39 @@
+"""
+Standard streams that each thread can redirect separately.
+The fleet mode captures what each depot prints and the planner service
+connects each session to its own socket, while other threads keep
+printing to and reading from the original streams.
+"""
+import threading
+
+
+class ThreadStream:
+    """
+    Stream forwarding to the stream the current thread has bound,
+    or to the original stream if it has not bound any.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def bind(self, stream):
+        """
+        Redirects the current thread to the stream.
+        """
+        self.local.stream = stream
+
+    def unbind(self):
+        """
+        Returns the current thread to the original stream.
+        """
+        self.local.stream = None
+
+    def current(self):
+        """
+        Returns the stream of the current thread.
+        """
+        return getattr(self.local, "stream", None) or self.stream
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
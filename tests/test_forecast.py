@@ -0,0 +1,42 @@
+"""
+Checks the rolling forecast against the models over the whole history.
+Run with "python3 -m pytest tests" from the project directory.
+"""
+import numpy as np
+import pytest
+
+import forecast
+
+SPECS = ["sma:1", "sma:5", "sma:10", "ewma:0.3", "weekday:1", "weekday:2"]
+
+
+@pytest.mark.parametrize("spec", SPECS)
+@pytest.mark.parametrize("first_day", [0, 3, 70])
+@pytest.mark.parametrize("days", [1, 6, 13, 30])
+def test_rolling_matches_planned(spec, first_day, days):
+    """
+    Rebuilt after first_day compacted days and with days pushed on top,
+    the rolling state plans the same as planned() over the history kept.
+    """
+    rng = np.random.default_rng(days)
+    history = rng.integers(0, 20, (days, 3))
+    rolling = forecast.RollingForecast.from_history(
+        spec, history, 3, first_day
+    )
+    assert (rolling.planned() == forecast.planned(history, spec)).all()
+    for row in rng.integers(0, 20, (9, 3)):
+        rolling.push(row)
+        history = np.vstack([history, row])
+        rolling = forecast.RollingForecast.from_dict(rolling.to_dict())
+        assert (rolling.planned() == forecast.planned(history, spec)).all()
+
+
+@pytest.mark.parametrize("spec", ["sma:10", "weekday:2"])
+def test_short_history_after_compaction(spec):
+    """
+    A history shorter than the window after compacted days plans
+    from the days kept, e.g. 5 for six days of 5.
+    """
+    history = np.full((6, 3), 5)
+    rolling = forecast.RollingForecast.from_history(spec, history, 3, 84)
+    assert rolling.planned().tolist() == [5, 5, 5]